@@ -1,7 +1,20 @@
+import time
+from functools import partial
+
+from sqlalchemy import create_engine, inspect, text
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tools import Tool
 from langchain_community.utilities import SQLDatabase
 from langchain_community.llms import Ollama
 from langchain_community.agent_toolkits import create_sql_agent
 
+from deadline import Deadline, DeadlineExceeded, REQUEST_BUDGET, install_sql_timeouts, stream_llm
+from summarizer import summarize, to_table
+from cascade import (
+    SMALL_MODEL, CascadeStats, ModelCascade, Verdict,
+    cascade_tiers, check_result, check_sql, clean_sql
+)
+
 SAFE_SQL_PROMPT = """
 You are an expert PostgreSQL SQL agent.
 
@@ -10,26 +23,108 @@ RULES:
 - NEVER use INSERT, UPDATE, DELETE, DROP, ALTER
 - Use only tables and columns from the schema
 - If the question cannot be answered, say so clearly
-- After executing SQL, explain the result in simple language
+- Run the final query with sql_db_query; its result is shown to the user directly
+"""
+
+EXPLAIN_PROMPT = """
+Question: {question}
+SQL: {sql}
+Result columns: {columns}
+Result rows (first {limit}): {rows}
+
+Explain the result in 2-3 simple sentences.
 """
 
+
+class DeadlineCallback(BaseCallbackHandler):
+    """
+    Checks the request deadline before every LLM call and tool call,
+    records time spent per stage, and keeps the last SQL and tool output
+    so a timeout can still return something useful.
+    """
+    raise_error = True
+
+    def __init__(self, deadline: Deadline):
+        self.deadline = deadline
+        self.last_sql = None
+        self.last_observation = None
+        self._started = {}
+
+    def _start(self, run_id):
+        self.deadline.check(self.partial())
+        self._started[run_id] = time.monotonic()
+
+    def _stop(self, stage, run_id):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            self.deadline.add_time(stage, time.monotonic() - started)
+
+    def partial(self):
+        if self.last_sql is None:
+            return None
+        partial = f"SQL: {self.last_sql}"
+        if self.last_observation is not None:
+            partial += f"\nResult: {self.last_observation}"
+        return partial
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._stop("llm", run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._stop("llm", run_id)
+
+    def on_agent_action(self, action, *, run_id, **kwargs):
+        if action.tool == "sql_db_query":
+            self.last_sql = action.tool_input
+            self.last_observation = None
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._stop("sql", run_id)
+        self.last_observation = output
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._stop("sql", run_id)
+
+
 class SQLAgentService:
-    def __init__(self, db_url: str, model_name: str, max_iterations: int = 5):
+    def __init__(self, db_url: str, model_name: str, max_iterations: int = 5,
+                 budget: float = REQUEST_BUDGET, llm_explain: bool = False,
+                 use_cascade: bool = True, small_model: str = SMALL_MODEL,
+                 cascade_stats: CascadeStats = None):
         self.db_url = db_url
         self.model_name = model_name
         self.max_iterations = max_iterations
+        self.budget = budget
+        # Only used for result shapes the local summarizer does not cover
+        self.llm_explain = llm_explain
+        # Small model first; model_name is only used when it falls short
+        self.tiers = cascade_tiers(model_name, use_cascade, small_model)
+        self.cascade = ModelCascade(self.tiers, cascade_stats)
+        self.engine = None
         self.db = None
+        self.table_columns = {}
+        self.agents = {}
+        self.llm = None
         self.agent = None
+        self.last_result = None
 
     def initialize(self):
-        self.db = SQLDatabase.from_uri(self.db_url)
+        # Statements run through this engine honour the request deadline
+        self.engine = create_engine(self.db_url)
+        install_sql_timeouts(self.engine)
+        self.db = SQLDatabase(self.engine)
 
-        llm = Ollama(
-            model=self.model_name,
-            temperature=0,
-            num_ctx=2048,
-            num_predict=256
-        )
+        inspector = inspect(self.engine)
+        self.table_columns = {
+            t.lower(): {c["name"].lower() for c in inspector.get_columns(t)}
+            for t in self.db.get_usable_table_names()
+        }
 
         schema_info = self.db.get_table_info()
 
@@ -40,7 +135,20 @@ Database schema:
 {schema_info}
 """
 
-        self.agent = create_sql_agent(
+        for model in self.tiers:
+            self.agents[model] = self._build_agent(model, system_prompt)
+        self.llm, self.agent = self.agents[self.model_name]
+
+    def _build_agent(self, model, system_prompt):
+        llm = Ollama(
+            model=model,
+            temperature=0,
+            num_ctx=2048,
+            num_predict=256,
+            timeout=int(self.budget)
+        )
+
+        agent = create_sql_agent(
             llm=llm,
             db=self.db,
             prefix=system_prompt,
@@ -50,11 +158,143 @@ Database schema:
             early_stopping_method="force",
             top_k=10
         )
+        self._capture_query_results(agent)
+        return llm, agent
+
+    def _capture_query_results(self, agent):
+        """
+        Swap the agent's sql_db_query tool for one that validates the SQL,
+        keeps the typed result and ends the run as soon as a query succeeds,
+        so the answer is summarized locally instead of by another LLM generation.
+        """
+        for i, tool in enumerate(agent.tools):
+            if tool.name == "sql_db_query":
+                query_tool = Tool(name=tool.name, description=tool.description, func=None)
+                query_tool.func = partial(self._run_query, query_tool)
+                agent.tools[i] = query_tool
+
+    def _explain(self, sql):
+        with self.engine.connect() as conn:
+            conn.execute(text(f"EXPLAIN {sql}"))
+
+    def _run_query(self, tool, query: str) -> str:
+        # Failed checks / queries go back to the agent so it can fix them
+        tool.return_direct = False
+        query = clean_sql(query)
+
+        verdict = check_sql(query, self.table_columns, explain=self._explain)
+        if not verdict.ok:
+            return f"Error: {'; '.join(verdict.reasons)}"
+
+        try:
+            with self.engine.connect() as conn:
+                result = conn.execute(text(query))
+                columns = list(result.keys())
+                rows = [tuple(r) for r in result.fetchall()]
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            return f"Error: {e}"
+
+        self.last_result = (query, columns, rows)
+        tool.return_direct = True
+        return str(rows)
+
+    def _summarize(self, question, result, llm, deadline):
+        sql, columns, rows = result
+        answer = summarize(question, columns, rows)
+        if answer is not None:
+            return answer
 
-    def run(self, question: str) -> str:
+        # No time left for an explanation: the table is still an answer
+        if self.llm_explain and not deadline.expired():
+            prompt = EXPLAIN_PROMPT.format(
+                question=question, sql=sql, columns=columns, rows=rows[:10], limit=10
+            )
+            try:
+                with deadline.stage("explain"):
+                    explanation = stream_llm(llm, prompt).strip()
+                return f"{explanation}\n\n{to_table(columns, rows, question)}"
+            except DeadlineExceeded:
+                pass
+
+        return to_table(columns, rows, question)
+
+    def ask(self, question: str, budget: float = None) -> dict:
+        """
+        Answer a question within a time budget, small model first.
+
+        Returns a dict with:
+        - status: "ok" or "timeout"
+        - answer: final answer, or a timeout message
+        - sql: SQL behind the answer (or None)
+        - tier: model that produced the answer (or None)
+        - confidence: local-check confidence of that answer
+        - attempts: [(model, confidence, seconds), ...] in cascade order
+        - partial: last SQL / result seen before a timeout (or None)
+        - stage: stage that ran out of time (or None)
+        - budget, elapsed, timings: seconds, total and per stage
+        """
         if not self.agent:
             raise RuntimeError("Agent not initialized")
-        return self.agent.run(question)
+
+        deadline = Deadline(budget or self.budget)
+        callback = DeadlineCallback(deadline)
+
+        def attempt(model):
+            llm, agent = self.agents[model]
+            self.last_result = None
+
+            # Bound each Ollama call and the agent loop by what is left
+            llm.timeout = max(int(deadline.remaining()), 1)
+            agent.max_execution_time = deadline.remaining()
+
+            with deadline.stage("agent"):
+                answer = agent.run(question, callbacks=[callback])
+
+            result = self.last_result
+            if result is None:
+                if deadline.expired():
+                    # The executor stops itself at max_execution_time
+                    raise DeadlineExceeded("agent", callback.partial())
+                return (answer, None, llm), Verdict(False, 0.0, ["no successful query"])
+            return (answer, result, llm), check_result(question, result[1], result[2])
+
+        try:
+            outcome = self.cascade.run(attempt)
+            answer, result, llm = outcome.payload
+            if result is not None:
+                answer = self._summarize(question, result, llm, deadline)
+        except DeadlineExceeded as e:
+            return {
+                "status": "timeout",
+                "answer": f"Timed out after {deadline.elapsed():.1f}s during '{e.stage}'.",
+                "sql": None,
+                "tier": None,
+                "confidence": 0.0,
+                "attempts": [],
+                "partial": e.partial or callback.partial(),
+                "stage": e.stage,
+                **deadline.report()
+            }
+
+        return {
+            "status": "ok",
+            "answer": answer,
+            "sql": result[0] if result else None,
+            "tier": outcome.tier,
+            "confidence": outcome.verdict.confidence,
+            "attempts": [(a.tier, a.verdict.confidence, round(a.seconds, 3)) for a in outcome.attempts],
+            "partial": None,
+            "stage": None,
+            **deadline.report()
+        }
+
+    def run(self, question: str, budget: float = None) -> str:
+        response = self.ask(question, budget)
+        if response["status"] == "timeout":
+            raise DeadlineExceeded(response["stage"], response["partial"])
+        return response["answer"]
 
     def get_schema(self) -> str:
         return self.db.get_table_info()
@@ -1,8 +1,20 @@
 import streamlit as st
 import time
+import uuid
+import os
 from langchain_community.utilities import SQLDatabase
 from langchain_ollama import OllamaLLM
 import re
+import sqlite3
+
+from history_store import HistoryStore, PAGE_SIZE
+from db_pool import SQLitePool
+from deadline import Deadline, DeadlineExceeded, REQUEST_BUDGET, current_deadline, stream_llm
+from approx import SampleStore, approximate, refine_exact, to_markdown
+from summarizer import summarize, to_table
+from cascade import CascadeStats, ModelCascade, Verdict, cascade_tiers, check_result, check_sql, clean_sql
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "business.db")
 
 # =========================
 # PAGE CONFIG
@@ -20,12 +32,20 @@ if "db" not in st.session_state:
     st.session_state.db = None
 if "schema" not in st.session_state:
     st.session_state.schema = None
-if "llm" not in st.session_state:
-    st.session_state.llm = None
+if "llms" not in st.session_state:
+    st.session_state.llms = None
+if "tiers" not in st.session_state:
+    st.session_state.tiers = []
 if "ready" not in st.session_state:
     st.session_state.ready = False
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
 if "history" not in st.session_state:
-    st.session_state.history = []
+    st.session_state.history = HistoryStore(st.session_state.session_id)
+if "history_page" not in st.session_state:
+    st.session_state.history_page = 0
+if "approx_pending" not in st.session_state:
+    st.session_state.approx_pending = None
 
 # =========================
 # RESULT HELPERS
@@ -45,19 +65,48 @@ def money(v):
 def percent(v):
     return f"{round(float(scalar(v)), 2)}%"
 
-def execute_sql(db, sql):
+def execute_sql(db, sql, with_columns=False):
     """
     Central SQL executor
     - Logs SQL
-    - Executes SQL
-    - Returns result
+    - Executes SQL on a pooled read-only connection
+    - Interrupts the query if the request deadline passes
+    - Returns result rows (or (columns, rows) with with_columns=True)
+    """
+    print("\n================ SQL EXECUTED ================")
+    print(sql)
+    print("=============================================\n")
+
+    deadline = current_deadline()
+    if deadline is None:
+        columns, rows = db.query(sql)
+    else:
+        # Waiting for a pooled connection counts against the budget too
+        try:
+            columns, rows = db.query(sql, interrupt=deadline.expired, timeout=deadline.remaining())
+        except TimeoutError:
+            raise DeadlineExceeded(deadline.current_stage or "sql") from None
+    if with_columns:
+        return columns, rows
+    return rows
+
+
+def execute_write(db, sql):
+    """
+    Central SQL writer: queues the statement for the pool's writer and
+    waits at most until the request deadline.
     """
     print("\n================ SQL EXECUTED ================")
     print(sql)
     print("=============================================\n")
 
-    result = db.run(sql)
-    return result
+    deadline = current_deadline()
+    if deadline is None:
+        return db.write(sql)
+    try:
+        return db.write(sql, timeout=deadline.remaining())
+    except TimeoutError:
+        raise DeadlineExceeded(deadline.current_stage or "sql") from None
 
 
 # =========================
@@ -86,7 +135,7 @@ def fast_router(question, db):
 - Database: SQLite
 - File: business.db
 - Tables: users, orders, order_items, products
-- Execution: Direct SQL via SQLAlchemy
+- Execution: Direct SQL via shared WAL connection pool
 - AI Role: SQL generation only (no execution)
 """     
         return sql, source_info
@@ -148,14 +197,14 @@ def crud_router(question, db):
         INSERT INTO users (name, email, city, signup_date)
         VALUES ('{name}', '{name}@mail.com', '{city}', DATE('now'))
         """
-        db.run(sql)
+        execute_write(db, sql)
         return sql, f"✅ User **{name}** added successfully"
 
     # DELETE USER
     if q.startswith("delete user"):
         name = q.replace("delete user", "").strip().title()
         sql = f"DELETE FROM users WHERE name = '{name}'"
-        db.run(sql)
+        execute_write(db, sql)
         return sql, f"🗑️ User **{name}** deleted successfully"
 
     # UPDATE PRODUCT PRICE
@@ -171,7 +220,7 @@ def crud_router(question, db):
         SET selling_price = {price}
         WHERE product_id = {pid}
         """
-        db.run(sql)
+        execute_write(db, sql)
         return sql, f"✅ Product **{pid}** price updated"
 
     return None
@@ -179,6 +228,17 @@ def crud_router(question, db):
 # =========================
 # AI SQL FALLBACK
 # =========================
+def make_llm(model, timeout=REQUEST_BUDGET):
+    # The Ollama client reads its HTTP timeout at construction, so a
+    # request builds one bounded by the time it has left
+    return OllamaLLM(
+        model=model,
+        temperature=0,
+        num_ctx=2048,
+        client_kwargs={"timeout": timeout}
+    )
+
+
 def ai_sql(question, schema, llm):
     prompt = f"""
 Generate ONE SQLite SELECT query.
@@ -193,13 +253,201 @@ Question:
 
 SQL:
 """
-    response = llm.invoke(prompt)
+    # Streamed so generation can be cut off at the request deadline
+    return stream_llm(llm, prompt).strip()
 
-    # Ollama may return str or object
-    if isinstance(response, str):
-        return response.strip()
 
-    return response.content.strip()
+def ai_answer(question, db, schema, tiers, deadline):
+    """
+    Model cascade: the small model writes SQL first; its SQL is checked
+    locally (parse, schema, EXPLAIN dry run, result shape) and only weak
+    answers are escalated to the larger model.
+    Returns (sql, answer).
+    """
+    approx_mode = st.session_state.get("approx_mode")
+
+    def attempt(model):
+        with deadline.stage("llm"):
+            # A stalled model cannot hold the request past its deadline
+            llm = make_llm(model, timeout=max(deadline.remaining(), 1))
+            sql = clean_sql(ai_sql(question, schema, llm))
+
+        with deadline.stage("sql"):
+            verdict = check_sql(
+                sql,
+                get_table_columns(),
+                explain=lambda q: execute_sql(db, f"EXPLAIN QUERY PLAN {q}")
+            )
+            if not verdict.ok:
+                return (sql, None), verdict
+
+            approx = approximate(get_samples(), sql, interrupt=deadline.expired) if approx_mode else None
+            try:
+                if approx:
+                    columns, rows = approx.columns, approx.rows
+                else:
+                    columns, rows = execute_sql(db, sql, with_columns=True)
+            except sqlite3.Error as e:
+                deadline.check()    # an interrupted query is a timeout, not a bad answer
+                return (sql, None), Verdict(False, 0.0, [f"query failed: {e}"])
+            return (sql, (approx, columns, rows)), check_result(question, columns, rows, verdict)
+
+    outcome = ModelCascade(tiers, get_cascade_stats()).run(attempt)
+    sql, data = outcome.payload
+
+    if data is None:
+        answer = f"⚠️ Could not generate a valid query: {'; '.join(outcome.verdict.reasons)}"
+    else:
+        approx, columns, rows = data
+        if approx:
+            answer = to_markdown(approx)
+            st.session_state.approx_pending = {"question": question, "sql": sql, "future": None}
+        else:
+            # Local, rule-based summary; no second LLM pass
+            answer = summarize(question, columns, rows) or to_table(columns, rows, question)
+
+    if len(tiers) > 1:
+        path = " → ".join(a.tier for a in outcome.attempts)
+        answer += f"\n\n_🪜 {path} (confidence {outcome.verdict.confidence:.0%})_"
+    return sql, answer
+
+
+def timeout_answer(err, deadline):
+    report = deadline.report()
+    spent = ", ".join(f"{k} {v:.2f}s" for k, v in report["timings"].items())
+    answer = (
+        f"⏱ **Timed out** during `{err.stage}` "
+        f"({report['elapsed']:.1f}s of {report['budget']:.0f}s budget)\n\n"
+        f"Time spent: {spent}"
+    )
+    if err.partial:
+        answer += f"\n\nPartial output:\n```\n{err.partial}\n```"
+    return answer
+
+
+# =========================
+# SHARED DB RESOURCES
+# =========================
+@st.cache_resource
+def get_pool():
+    # One pool per process, shared by every session and thread
+    return SQLitePool(DB_PATH)
+
+
+@st.cache_resource
+def get_schema():
+    return SQLDatabase.from_uri(f"sqlite:///{DB_PATH}").get_table_info()
+
+
+@st.cache_resource
+def get_table_columns():
+    # {table: {column, ...}} for validating generated SQL
+    db = get_pool()
+    tables = [r[0] for r in db.read("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    return {
+        t.lower(): {r[1].lower() for r in db.read(f"PRAGMA table_info('{t}')")}
+        for t in tables
+    }
+
+
+@st.cache_resource
+def get_cascade_stats():
+    # Per-tier hit rates / latency across all sessions, for tuning thresholds
+    return CascadeStats()
+
+
+def render_cascade_stats():
+    stats = get_cascade_stats().snapshot()
+    if not stats:
+        st.caption("No AI questions yet")
+    for tier, t in stats.items():
+        st.caption(
+            f"**{tier}**: {t['attempts']} tries · hit rate {t['hit_rate']:.0%} · "
+            f"escalated {t['escalated']} · avg {t['avg_latency']:.2f}s (p95 {t['p95_latency']:.2f}s) · "
+            f"avg confidence {t['avg_confidence']:.2f}"
+        )
+
+
+@st.cache_resource
+def get_samples():
+    # Fact-table samples for approximate aggregates. Built (or rebuilt if
+    # row counts changed) by Initialize System, never inside a request;
+    # "Rebuild samples" forces a fresh draw.
+    return SampleStore(DB_PATH)
+
+
+def render_refinement(db):
+    pending = st.session_state.approx_pending
+    if not pending:
+        return
+
+    st.caption("≈ The last answer was estimated from a sample.")
+    future = pending["future"]
+    if future is None:
+        if st.button("🎯 Refine to exact answer"):
+            pending["future"] = refine_exact(db, pending["sql"])
+            st.rerun()
+    elif future.done():
+        try:
+            columns, rows = future.result()
+            question = pending["question"]
+            exact = summarize(question, columns, rows) or to_table(columns, rows, question)
+            st.markdown(f"🎯 **Exact result**\n\n{exact}")
+        except Exception as e:
+            st.error(f"Exact query failed: {e}")
+    else:
+        st.info("⏳ Computing the exact answer in the background...")
+        st.button("🔄 Check again")
+
+
+def render_pool_metrics(db):
+    m = db.metrics()
+    st.caption(
+        f"Reads: {m['reads']} · avg wait {m['read_wait_avg'] * 1000:.1f} ms "
+        f"(max {m['read_wait_max'] * 1000:.1f} ms) · idle readers {m['idle_readers']}"
+    )
+    st.caption(
+        f"Writes: {m['writes']} in {m['commits']} commits · errors {m['write_errors']} · "
+        f"queue {m['queue_depth']} (max {m['max_queue_depth']}) · "
+        f"avg wait {m['write_wait_avg'] * 1000:.1f} ms"
+    )
+
+
+# =========================
+# HISTORY RENDERING
+# =========================
+def render_entry(entry, store):
+    with st.chat_message("user"):
+        st.markdown(entry.question)
+    with st.chat_message("assistant"):
+        st.markdown(entry.preview)
+        if entry.truncated:
+            # Full result lives only in SQLite; load it when asked
+            if st.button("📄 Show full result", key=f"full_{entry.id}"):
+                st.markdown(store.full_answer(entry.id))
+        st.caption(f"⏱ {entry.elapsed:.2f}s")
+
+
+def render_older(store):
+    older = store.older_count()
+    if not older:
+        return
+
+    pages = (older + PAGE_SIZE - 1) // PAGE_SIZE
+    page = min(st.session_state.history_page, pages - 1)
+
+    with st.expander(f"🕘 Earlier messages ({older})"):
+        prev_col, info_col, next_col = st.columns([1, 2, 1])
+        if prev_col.button("⬅ Older", disabled=page >= pages - 1):
+            st.session_state.history_page = page + 1
+            st.rerun()
+        info_col.caption(f"Page {page + 1} of {pages}")
+        if next_col.button("Newer ➡", disabled=page == 0):
+            st.session_state.history_page = page - 1
+            st.rerun()
+
+        for entry in store.older_page(page):
+            render_entry(entry, store)
 
 
 # =========================
@@ -210,27 +458,46 @@ with st.sidebar:
 
     if st.button("🚀 Initialize System"):
         with st.spinner("Initializing system..."):
-            db = SQLDatabase.from_uri(
-                "sqlite:///C:/Users/keval/Desktop/sql_agent_clean/app/business.db"
-            )
-            schema = db.get_table_info()
+            db = get_pool()
+            schema = get_schema()
 
-            llm = OllamaLLM(
-                model="phi3",
-                temperature=0,
-                num_ctx=2048
+            tiers = cascade_tiers(
+                st.session_state.get("model_name", "llama3"),
+                st.session_state.get("use_cascade", True)
             )
-            llm.invoke("OK")
+            llms = {model: make_llm(model) for model in tiers}
+            # Warm up the first tier; larger models load on first escalation
+            llms[tiers[0]].invoke("OK")
+
+            # Samples are only rebuilt when the fact tables changed size
+            get_samples().refresh()
 
             st.session_state.db = db
             st.session_state.schema = schema
-            st.session_state.llm = llm
+            st.session_state.llms = llms
+            st.session_state.tiers = tiers
             st.session_state.ready = True
 
             st.success("✅ System ready")
 
+    if st.session_state.ready:
+        with st.expander("📈 DB Pool Metrics"):
+            render_pool_metrics(st.session_state.db)
+        with st.expander("🪜 Model Cascade"):
+            render_cascade_stats()
+
+        st.toggle(
+            "⚡ Approximate aggregates",
+            key="approx_mode",
+            help="Answer SUM / COUNT / AVG questions from a sample, with 95% confidence intervals"
+        )
+        if st.button("♻️ Rebuild samples"):
+            with st.spinner("Sampling fact tables..."):
+                get_samples().refresh(force=True)
+
     if st.button("🧹 Clear Chat"):
-        st.session_state.history = []
+        st.session_state.history.clear()
+        st.session_state.history_page = 0
         st.rerun()
 
         # Sidebar for configuration
@@ -249,7 +516,14 @@ with st.sidebar:
     model_name = st.selectbox(
         "Ollama Model",
         options=["llama3", "llama2", "mistral", "codellama", "phi3"],
-        index=0
+        index=0,
+        key="model_name"
+    )
+    st.checkbox(
+        "🪜 Small-model-first cascade",
+        value=True,
+        key="use_cascade",
+        help="Try phi3 first and escalate to the selected model only when its SQL fails local checks"
     )
     
 
@@ -267,12 +541,10 @@ if st.session_state.ready:
 # CHAT
 # =========================
     if st.session_state.ready:
-        for q, a, t in st.session_state.history:
-            with st.chat_message("user"):
-                st.markdown(q)
-            with st.chat_message("assistant"):
-                st.markdown(a)
-                st.caption(f"⏱ {t:.2f}s")
+        render_older(st.session_state.history)
+        for entry in st.session_state.history.recent:
+            render_entry(entry, st.session_state.history)
+        render_refinement(st.session_state.db)
 
         question = st.chat_input("Ask a business question...")
 
@@ -282,40 +554,45 @@ if st.session_state.ready:
 
             with st.chat_message("assistant"):
                 start = time.time()
-
-                result = (
-                    crud_router(question, st.session_state.db)
-                    or fast_router(question, st.session_state.db)
-                )
-
-                if result:
-                    sql, answer = result
-                else:
-                    sql = ai_sql(
-                        question,
-                        st.session_state.schema,
-                        st.session_state.llm
-                    )
-                    res = st.session_state.db.run(sql)
-                    answer = f"{res}"
+                deadline = Deadline(REQUEST_BUDGET)
+                sql = "-- not generated"
+                st.session_state.approx_pending = None
+
+                try:
+                    with deadline.stage("route"):
+                        result = (
+                            crud_router(question, st.session_state.db)
+                            or fast_router(question, st.session_state.db)
+                        )
+
+                    if result:
+                        sql, answer = result
+                    else:
+                        sql, answer = ai_answer(
+                            question,
+                            st.session_state.db,
+                            st.session_state.schema,
+                            st.session_state.tiers,
+                            deadline
+                        )
+                except DeadlineExceeded as e:
+                    answer = timeout_answer(e, deadline)
 
                 elapsed = time.time() - start
 
-                st.markdown(f"""
-    **SQL Executed**
-    ```sql
-    {sql}
-    ``python
-    **Result**
-    {answer}
-    """)
+                st.markdown(
+                    f"**SQL Executed**\n```sql\n{sql.strip()}\n```\n\n"
+                    f"**Result**\n\n{answer}"
+                )
 
                 st.caption(f"⏱ {elapsed:.2f}s")
 
-                # Save history
-                st.session_state.history.append(
-                    (question, answer, elapsed)
-                )
+                # Save history (full answer goes to SQLite, preview stays in memory)
+                st.session_state.history.append(question, answer, elapsed)
+
+                # Rerun so the refine button renders under the saved answer
+                if st.session_state.approx_pending:
+                    st.rerun()
 
 else:
     st.info("👈 Click **Initialize System** to start")
@@ -0,0 +1,459 @@
+import math
+import os
+import random
+import re
+import sqlite3
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# =========================
+# CONFIG
+# =========================
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "samples")
+FACT_TABLES = ["order_items", "orders"]   # sampled in this priority order
+SAMPLE_SIZE = 50000
+CONFIDENCE_Z = 1.96                       # 95% intervals
+MIN_SAMPLE_ROWS = 30                      # fewer matching sample rows per cell: run exactly
+MAX_RELATIVE_ERROR = 0.05                 # wider intervals (half-width / value): run exactly
+PROGRESS_OPS = 1000
+REFINE_BUDGET = 120.0                     # seconds an exact refinement may take
+
+AGGREGATE = re.compile(r"^(SUM|COUNT|AVG)\s*\((.*)\)$", re.IGNORECASE | re.DOTALL)
+ALIAS = re.compile(r"^(.*?)\s+(?:AS\s+)?([A-Za-z_]\w*)$", re.IGNORECASE | re.DOTALL)
+UNSUPPORTED = re.compile(
+    r"\b(DISTINCT|LIMIT|HAVING|UNION|INTERSECT|EXCEPT|OVER|WITH|MIN|MAX)\b",
+    re.IGNORECASE
+)
+
+
+class Estimate(namedtuple("Estimate", ["value", "low", "high"])):
+    """An approximate aggregate with its confidence interval."""
+
+    def __str__(self):
+        if self.value is None:
+            return "–"
+        half = (self.high - self.low) / 2
+        return f"{self.value:,.2f} ± {half:,.2f}"
+
+
+ApproxPlan = namedtuple("ApproxPlan", ["table", "sql", "columns", "outputs", "order_by"])
+ApproxResult = namedtuple("ApproxResult", ["table", "sql", "columns", "rows", "sample_size", "population"])
+
+
+# =========================
+# SAMPLES
+# =========================
+class SampleStore:
+    """
+    Uniform reservoir samples of the large fact tables.
+
+    Each sample lives in its own SQLite file under `sample_dir`, in a table
+    with the same name as the source. Queries run on a connection to the
+    sample file with the source database attached read-only, so the fact
+    table resolves to the sample and every other table to the full data.
+    """
+
+    def __init__(self, db_path: str, sample_dir: str = SAMPLE_DIR,
+                 fact_tables=None, sample_size: int = SAMPLE_SIZE, seed: int = 42):
+        self.db_path = db_path
+        self.sample_dir = sample_dir
+        self.fact_tables = list(fact_tables or FACT_TABLES)
+        self.sample_size = sample_size
+        self.seed = seed
+        os.makedirs(sample_dir, exist_ok=True)
+
+    def sample_path(self, table):
+        return os.path.join(self.sample_dir, f"{table}.sample.db")
+
+    def _source(self):
+        return sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+
+    def info(self, table):
+        """(population, sample_size) recorded when the sample was built, or None."""
+        path = self.sample_path(table)
+        if not os.path.exists(path):
+            return None
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            return conn.execute("SELECT population, sample_size FROM _sample_meta").fetchone()
+        finally:
+            conn.close()
+
+    def is_stale(self, table):
+        info = self.info(table)
+        if info is None:
+            return True
+        src = self._source()
+        try:
+            population = src.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        finally:
+            src.close()
+        return population != info[0]
+
+    def refresh(self, force=False):
+        for table in self.fact_tables:
+            if force or self.is_stale(table):
+                self.build(table)
+
+    def build(self, table):
+        """Draw a fresh reservoir sample (Algorithm R) in one pass over the table."""
+        rng = random.Random(self.seed)
+        src = self._source()
+        try:
+            create_sql = src.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                (table,)
+            ).fetchone()[0]
+            cur = src.execute(f"SELECT * FROM {table}")
+            reservoir = []
+            seen = 0
+            while True:
+                chunk = cur.fetchmany(5000)
+                if not chunk:
+                    break
+                for row in chunk:
+                    seen += 1
+                    if len(reservoir) < self.sample_size:
+                        reservoir.append(row)
+                    else:
+                        j = rng.randrange(seen)
+                        if j < self.sample_size:
+                            reservoir[j] = row
+        finally:
+            src.close()
+
+        # Build into a temp file and swap it in, so readers never see a half-built sample
+        path = self.sample_path(table)
+        tmp_path = path + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.execute(create_sql)
+            if reservoir:
+                marks = ", ".join("?" * len(reservoir[0]))
+                conn.executemany(f"INSERT INTO {table} VALUES ({marks})", reservoir)
+            conn.execute("CREATE TABLE _sample_meta (population INTEGER, sample_size INTEGER, built_at REAL)")
+            conn.execute("INSERT INTO _sample_meta VALUES (?, ?, ?)", (seen, len(reservoir), time.time()))
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp_path, path)
+
+    def connect(self, table):
+        conn = sqlite3.connect(f"file:{self.sample_path(table)}?mode=ro", uri=True, check_same_thread=False)
+        conn.execute("ATTACH DATABASE ? AS src", (f"file:{self.db_path}?mode=ro",))
+        return conn
+
+
+# =========================
+# SQL REWRITE
+# =========================
+def _mask_strings(sql):
+    """Blank out string literals so keyword / paren scans ignore them."""
+    return re.sub(r"'(?:[^']|'')*'", lambda m: "'" + " " * (len(m.group(0)) - 2) + "'", sql)
+
+
+def _top_level_split(text, masked, sep=","):
+    parts, depth, start = [], 0, 0
+    for i, ch in enumerate(masked):
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == sep and depth == 0:
+            parts.append(text[start:i].strip())
+            start = i + 1
+    parts.append(text[start:].strip())
+    return parts
+
+
+def _find_top_level(masked, keyword, start=0):
+    depth = 0
+    pattern = re.compile(rf"\b{keyword}\b", re.IGNORECASE)
+    for i in range(start, len(masked)):
+        ch = masked[i]
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif depth == 0 and pattern.match(masked, i):
+            if i == 0 or not (masked[i - 1].isalnum() or masked[i - 1] == "_"):
+                return i
+    return -1
+
+
+def _single_call(expr):
+    """True if `expr` is exactly one call: NAME( ... ) with matching outer parens."""
+    open_at = expr.find("(")
+    depth = 0
+    for i in range(open_at, len(expr)):
+        if expr[i] == "(":
+            depth += 1
+        elif expr[i] == ")":
+            depth -= 1
+            if depth == 0:
+                return i == len(expr) - 1
+    return False
+
+
+def _split_alias(item):
+    """Split a select item into (expression, output column name)."""
+    m = ALIAS.match(item)
+    if m:
+        expr = m.group(1).strip()
+        # "SUM(x) total" / "u.city AS town" carry an alias; "CASE ... END" does not
+        if expr.endswith(")") or re.match(r"^[\w.\"]+$", expr):
+            return expr, m.group(2)
+    if re.match(r"^[\w.\"]+$", item):
+        return item, item.split(".")[-1].strip('"')
+    return item, item
+
+
+def plan_approx(sql, fact_tables=None):
+    """
+    Plan an approximate version of an aggregate query, or return None if
+    the query is not a plain SELECT of SUM/COUNT/AVG (optionally grouped)
+    over one of the fact tables.
+
+    The fact table must be the FROM table and every join an INNER join
+    that keeps one row per fact row: to a dimension, or to a fact table
+    later (coarser) in `fact_tables`. Outer joins would keep rows that
+    are not in the sample and fan-out joins break the per-row scaling.
+
+    Each aggregate is rewritten to the per-group sample sums it needs for
+    a scaled-up estimate and its variance: SUM(x), SUM(x*x) and COUNT(x).
+    """
+    fact_tables = fact_tables or FACT_TABLES
+    sql = sql.strip().rstrip(";").strip()
+    masked = _mask_strings(sql)
+
+    if ";" in masked or not re.match(r"^SELECT\b", masked, re.IGNORECASE):
+        return None
+    if UNSUPPORTED.search(masked) or len(re.findall(r"\bSELECT\b", masked, re.IGNORECASE)) != 1:
+        return None
+
+    from_at = _find_top_level(masked, "FROM")
+    if from_at < 0:
+        return None
+    select_list = sql[len("SELECT"):from_at]
+    rest, rest_masked = sql[from_at:], masked[from_at:]
+
+    clause_ends = [_find_top_level(rest_masked, k) for k in ("WHERE", "GROUP", "HAVING", "ORDER", "LIMIT")]
+    from_clause = rest_masked[:min([i for i in clause_ends if i >= 0], default=len(rest_masked))]
+    m = re.match(r"^FROM\s+([\w.]+)", from_clause, re.IGNORECASE)
+    names = [t.lower() for t in fact_tables]
+    if not m or m.group(1).split(".")[-1].lower() not in names:
+        return None
+    position = names.index(m.group(1).split(".")[-1].lower())
+    table = fact_tables[position]
+
+    if "," in from_clause or re.search(r"\b(LEFT|RIGHT|FULL|OUTER|CROSS|NATURAL)\b", from_clause, re.IGNORECASE):
+        return None
+    for joined in re.findall(r"\bJOIN\s+([\w.]+)", from_clause, re.IGNORECASE):
+        if joined.split(".")[-1].lower() in names[:position + 1]:
+            return None
+
+    order_by = []
+    order_at = _find_top_level(rest_masked, "ORDER")
+    if order_at >= 0:
+        order_clause = rest[order_at:]
+        rest = rest[:order_at].rstrip()
+        rest_masked = rest_masked[:order_at]
+        m = re.match(r"^ORDER\s+BY\s+(.*)$", order_clause, re.IGNORECASE | re.DOTALL)
+        if not m:
+            return None
+        for key in _top_level_split(m.group(1), _mask_strings(m.group(1))):
+            km = re.match(r"^(.*?)(?:\s+(ASC|DESC))?$", key, re.IGNORECASE | re.DOTALL)
+            order_by.append((km.group(1).strip(), (km.group(2) or "ASC").upper() == "DESC"))
+
+    # Positional GROUP BY would point at the wrong columns after the rewrite
+    if re.search(r"\bGROUP\s+BY\b.*\b\d+\b", rest_masked, re.IGNORECASE | re.DOTALL):
+        return None
+
+    columns, outputs, select_items = [], [], []
+    for item in _top_level_split(select_list, _mask_strings(select_list)):
+        expr, alias = _split_alias(item)
+        m = AGGREGATE.match(expr)
+        if m and _single_call(expr):
+            func, arg = m.group(1).upper(), m.group(2).strip()
+            if func != "COUNT" and arg == "*":
+                return None
+            i = len(outputs)
+            if func == "COUNT":
+                counted = "COUNT(*)" if arg == "*" else f"COUNT({arg})"
+                select_items += [f"{counted} AS __s{i}", f"{counted} AS __q{i}", f"{counted} AS __c{i}"]
+            else:
+                select_items += [
+                    f"SUM({arg}) AS __s{i}",
+                    f"SUM(1.0 * ({arg}) * ({arg})) AS __q{i}",
+                    f"COUNT({arg}) AS __c{i}",
+                ]
+            outputs.append(("agg", func, expr))
+        elif AGGREGATE.search(expr) or re.search(r"\b(SUM|COUNT|AVG)\s*\(", expr, re.IGNORECASE):
+            # Aggregates inside expressions (ratios etc.) are not supported
+            return None
+        else:
+            select_items.append(expr if alias == expr else f"{expr} AS {alias}")
+            outputs.append(("key", None, expr))
+        columns.append(alias)
+
+    if not any(kind == "agg" for kind, _, _ in outputs):
+        return None
+
+    # ORDER BY keys must name an output column (alias, expression or position)
+    resolved = []
+    for key, desc in order_by:
+        index = _resolve_column(key, columns, outputs)
+        if index is None:
+            return None
+        resolved.append((index, desc))
+
+    rewritten = f"SELECT {', '.join(select_items)} {rest}"
+    return ApproxPlan(table, rewritten, columns, outputs, resolved)
+
+
+def _resolve_column(key, columns, outputs):
+    if key.isdigit() and 1 <= int(key) <= len(columns):
+        return int(key) - 1
+    norm = re.sub(r"\s+", "", key).lower()
+    for i, (alias, (_, _, expr)) in enumerate(zip(columns, outputs)):
+        if norm in (alias.lower(), re.sub(r"\s+", "", expr).lower()):
+            return i
+    return None
+
+
+# =========================
+# ESTIMATION
+# =========================
+def _estimate(func, s, q, c, n, population):
+    """
+    Scale sample sums up to the population with a normal-approximation
+    interval. Returns None if the sums are inconsistent with n sampled
+    rows (sum of squares below s*s/n), i.e. the query is not row-per-sample.
+    """
+    s = s or 0
+    q = q or 0
+    c = c or 0
+    exact = n >= population
+    fpc = 0.0 if exact else 1 - n / population    # finite population correction
+
+    if func == "AVG":
+        if c == 0:
+            return Estimate(None, None, None)
+        mean = s / c
+        var = (q - s * s / c) / (c - 1) if c > 1 else 0.0
+        half = CONFIDENCE_Z * math.sqrt(max(var, 0.0) * fpc / c)
+        return Estimate(mean, mean - half, mean + half)
+
+    # SUM / COUNT: total of y over the population, where y is 0 for rows
+    # outside the group (or filtered out), estimated from n sampled rows
+    if n == 0:
+        return Estimate(None, None, None)
+    if func == "SUM" and c == 0:
+        return Estimate(None, None, None)
+    if q < s * s / n * (1 - 1e-9):
+        return None
+    mean = s / n
+    var = (q - s * s / n) / (n - 1) if n > 1 else 0.0
+    total = population * mean
+    half = CONFIDENCE_Z * population * math.sqrt(max(var, 0.0) * fpc / n)
+    return Estimate(total, total - half, total + half)
+
+
+def approximate(store: SampleStore, sql: str, interrupt=None):
+    """
+    Run an aggregate query on the fact-table sample.
+    Returns an ApproxResult, or None if the query is not eligible or the
+    sample cannot answer it well enough: any aggregate (in any group)
+    backed by fewer than MIN_SAMPLE_ROWS matching rows, or with an
+    interval wider than MAX_RELATIVE_ERROR of its value. The caller then
+    runs the query exactly.
+    """
+    plan = plan_approx(sql, store.fact_tables)
+    if plan is None:
+        return None
+    info = store.info(plan.table)
+    if info is None:
+        return None
+    population, n = info
+
+    conn = store.connect(plan.table)
+    try:
+        if interrupt is not None:
+            conn.set_progress_handler(lambda: 1 if interrupt() else 0, PROGRESS_OPS)
+        raw = conn.execute(plan.sql).fetchall()
+    finally:
+        conn.close()
+
+    rows = []
+    for r in raw:
+        row, pos = [], 0
+        for kind, func, _ in plan.outputs:
+            if kind == "key":
+                row.append(r[pos])
+                pos += 1
+            else:
+                s, q, c = r[pos:pos + 3]
+                estimate = _estimate(func, s, q, c, n, population)
+                if estimate is None or (n < population and not _precise(estimate, c)):
+                    return None
+                row.append(estimate)
+                pos += 3
+        rows.append(tuple(row))
+
+    # Apply ORDER BY on the estimates (stable sorts, last key first)
+    for index, desc in reversed(plan.order_by):
+        rows.sort(key=lambda row: _sort_key(row[index]), reverse=desc)
+
+    return ApproxResult(plan.table, plan.sql, plan.columns, rows, n, population)
+
+
+def _precise(estimate, matched):
+    """True if a sampled estimate rests on enough rows and is tight enough to show."""
+    if matched is None or matched < MIN_SAMPLE_ROWS or not estimate.value:
+        return False
+    half = (estimate.high - estimate.low) / 2
+    return half <= MAX_RELATIVE_ERROR * abs(estimate.value)
+
+
+def _sort_key(value):
+    if isinstance(value, Estimate):
+        value = value.value
+    return (value is None, value if value is not None else 0)
+
+
+def to_markdown(result: ApproxResult) -> str:
+    header = "| " + " | ".join(result.columns) + " |"
+    divider = "| " + " | ".join("---" for _ in result.columns) + " |"
+    lines = [header, divider]
+    for row in result.rows:
+        lines.append("| " + " | ".join(str(v) for v in row) + " |")
+    lines.append("")
+    lines.append(
+        f"≈ Estimated from a {result.sample_size:,}-row sample of `{result.table}` "
+        f"({result.population:,} rows), 95% confidence intervals"
+    )
+    return "\n".join(lines)
+
+
+# =========================
+# BACKGROUND REFINEMENT
+# =========================
+_refiner = ThreadPoolExecutor(max_workers=2, thread_name_prefix="exact-refine")
+
+
+def _bounded_query(pool, sql, budget):
+    stop = time.monotonic() + budget
+    return pool.query(sql, interrupt=lambda: time.monotonic() > stop, timeout=budget)
+
+
+def refine_exact(pool, sql, budget=REFINE_BUDGET):
+    """
+    Run the exact query in the background; returns a Future of
+    (columns, rows).
+    The query is interrupted after `budget` seconds so an abandoned
+    refinement cannot hold a reader connection indefinitely.
+    """
+    return _refiner.submit(_bounded_query, pool, sql, budget)
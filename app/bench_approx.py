@@ -0,0 +1,196 @@
+"""
+Accuracy / latency benchmark for approximate aggregates.
+
+Copies business.db, scales order_items up, builds the samples and runs a
+set of typical aggregate questions both exactly and on the sample.
+Queries the sample cannot answer precisely enough fall back to exact.
+
+    python bench_approx.py --scale 50 --sample-size 50000 --draws 5
+
+Accuracy is pooled over `--draws` independent samples: the cells of one
+query share a single sample, so one draw says little about coverage.
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from approx import SAMPLE_SIZE, Estimate, SampleStore, approximate
+
+# =========================
+# QUERIES
+# =========================
+QUERIES = {
+    "avg item value by city": """
+        SELECT u.city, AVG(p.selling_price * oi.quantity) AS avg_value
+        FROM order_items oi
+        JOIN orders o ON oi.order_id = o.order_id
+        JOIN users u ON o.user_id = u.user_id
+        JOIN products p ON oi.product_id = p.product_id
+        GROUP BY u.city
+        ORDER BY avg_value DESC
+    """,
+    "revenue by category": """
+        SELECT p.category, SUM(p.selling_price * oi.quantity) AS revenue
+        FROM order_items oi
+        JOIN products p ON oi.product_id = p.product_id
+        GROUP BY p.category
+    """,
+    "units sold by month": """
+        SELECT strftime('%m', o.order_date) AS month, SUM(oi.quantity) AS units
+        FROM order_items oi
+        JOIN orders o ON oi.order_id = o.order_id
+        GROUP BY month
+        ORDER BY month
+    """,
+    "total profit": """
+        SELECT SUM((p.selling_price - p.cost_price) * oi.quantity) AS profit
+        FROM order_items oi
+        JOIN products p ON oi.product_id = p.product_id
+    """,
+    "rare product lines": """
+        SELECT COUNT(*) AS items
+        FROM order_items oi
+        WHERE oi.product_id = 7 AND oi.quantity = 3
+    """,
+    "avg value per user": """
+        SELECT u.name, AVG(p.selling_price * oi.quantity) AS avg_value
+        FROM order_items oi
+        JOIN orders o ON oi.order_id = o.order_id
+        JOIN users u ON o.user_id = u.user_id
+        JOIN products p ON oi.product_id = p.product_id
+        GROUP BY u.name
+        ORDER BY avg_value DESC
+    """,
+    "electronics line items": """
+        SELECT COUNT(*) AS items
+        FROM order_items oi
+        JOIN products p ON oi.product_id = p.product_id
+        WHERE p.category = 'Electronics'
+    """,
+}
+
+
+def scale_up(db_path, factor):
+    """Grow order_items `factor` times with randomised products / quantities."""
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TEMP TABLE base AS SELECT order_id FROM order_items")
+    for _ in range(factor - 1):
+        conn.execute("""
+            INSERT INTO order_items (order_id, product_id, quantity)
+            SELECT order_id, ABS(RANDOM()) % 120 + 1, ABS(RANDOM()) % 3 + 1
+            FROM base
+        """)
+    conn.commit()
+    count = conn.execute("SELECT COUNT(*) FROM order_items").fetchone()[0]
+    conn.close()
+    return count
+
+
+def timed(fn, repeat):
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return result, statistics.median(times)
+
+
+def compare(exact_rows, approx_rows):
+    """
+    Relative errors, covered cells, cells and missed groups over all
+    aggregate cells, matched by group keys.
+    """
+    def split(row):
+        keys = tuple(v for v in row if not isinstance(v, Estimate))
+        return keys, [v for v in row if isinstance(v, Estimate)]
+
+    approx_by_key = dict(split(r) for r in approx_rows)
+    errors, covered, cells, missing = [], 0, 0, 0
+    for row in exact_rows:
+        n_keys = len(row) - len(next(iter(approx_by_key.values())))
+        keys, values = tuple(row[:n_keys]), row[n_keys:]
+        estimates = approx_by_key.get(keys)
+        if estimates is None:
+            missing += 1
+            continue
+        for exact, est in zip(values, estimates):
+            cells += 1
+            if exact:
+                errors.append(abs(est.value - exact) / abs(exact))
+            if est.low <= exact <= est.high:
+                covered += 1
+    return errors, covered, cells, missing
+
+
+# =========================
+# MAIN
+# =========================
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "business.db"))
+    parser.add_argument("--scale", type=int, default=50)
+    parser.add_argument("--sample-size", type=int, default=SAMPLE_SIZE)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--draws", type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="approx_bench_")
+    try:
+        db_path = os.path.join(workdir, "business.db")
+        shutil.copy(args.db, db_path)
+
+        start = time.perf_counter()
+        rows = scale_up(db_path, args.scale)
+        print(f"order_items scaled to {rows:,} rows in {time.perf_counter() - start:.1f}s")
+
+        conn = sqlite3.connect(db_path)
+        exact = {}
+        for name, sql in QUERIES.items():
+            exact[name] = timed(lambda: conn.execute(sql).fetchall(), args.repeat)
+        conn.close()
+
+        # name -> [approx seconds, errors, covered, cells, missed, fallbacks]
+        tally = {name: [[], [], 0, 0, 0, 0] for name in QUERIES}
+        for draw in range(args.draws):
+            store = SampleStore(db_path, os.path.join(workdir, "samples"),
+                                sample_size=args.sample_size, seed=draw)
+            start = time.perf_counter()
+            store.refresh(force=True)
+            print(f"sample {draw + 1}/{args.draws} built in {time.perf_counter() - start:.1f}s")
+            for name, sql in QUERIES.items():
+                approx, t_approx = timed(lambda: approximate(store, sql), args.repeat)
+                t = tally[name]
+                if approx is None:
+                    t[5] += 1
+                    continue
+                errors, covered, cells, missing = compare(exact[name][0], approx.rows)
+                t[0].append(t_approx)
+                t[1] += errors
+                t[2] += covered
+                t[3] += cells
+                t[4] += missing
+
+        print(f"\n{'query':<26}{'exact':>10}{'approx':>10}{'speedup':>9}{'max err':>10}{'CI cover':>10}{'missed':>8}")
+        for name in QUERIES:
+            t_exact = exact[name][1]
+            times, errors, covered, cells, missing, fallbacks = tally[name]
+            if not times:
+                print(f"{name:<26}{t_exact * 1000:>8.0f}ms  falls back to exact")
+                continue
+            t_approx = statistics.median(times)
+            note = f"  ({fallbacks}/{args.draws} draws fell back)" if fallbacks else ""
+            print(
+                f"{name:<26}{t_exact * 1000:>8.0f}ms{t_approx * 1000:>8.0f}ms"
+                f"{t_exact / max(t_approx, 1e-9):>8.1f}x{max(errors, default=0.0) * 100:>9.2f}%"
+                f"{covered * 100 / max(cells, 1):>9.0f}%{missing:>8}{note}"
+            )
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
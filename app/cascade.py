@@ -0,0 +1,276 @@
+import re
+import sqlite3
+import threading
+import time
+from collections import deque, namedtuple
+
+from deadline import DeadlineExceeded
+
+# =========================
+# CONFIG
+# =========================
+SMALL_MODEL = "phi3"
+MIN_CONFIDENCE = 0.7     # below this the next (larger) model is tried
+LATENCY_WINDOW = 200     # recent latencies kept per tier for percentiles
+
+SINGLE_VALUE_WORDS = re.compile(r"\b(how many|how much|total|average|avg|count|sum|what is the|overall)\b", re.IGNORECASE)
+GROUPING_WORDS = re.compile(r"\b(by|per|each|every|for all|breakdown|group)\b", re.IGNORECASE)
+LIST_WORDS = re.compile(r"\b(list|show|which|top|bottom|all)\b", re.IGNORECASE)
+TOP_N = re.compile(r"\b(?:top|bottom|first|last)\s+(\d+)\b", re.IGNORECASE)
+SQL_KEYWORDS = {
+    "select", "from", "where", "join", "on", "as", "and", "or", "not", "group", "by",
+    "order", "limit", "having", "inner", "left", "right", "outer", "cross", "using",
+    "lateral", "natural", "full", "union", "except", "intersect", "window",
+}
+# A table name and its optional alias; the alias never swallows a keyword
+TABLE_REF = re.compile(
+    r"([\w.\"]+)(?:\s+(?:AS\s+)?(?!(?:" + "|".join(sorted(SQL_KEYWORDS)) + r")\b)(\w+))?",
+    re.IGNORECASE
+)
+
+Verdict = namedtuple("Verdict", ["ok", "confidence", "reasons"])
+Attempt = namedtuple("Attempt", ["tier", "verdict", "seconds"])
+CascadeResult = namedtuple("CascadeResult", ["tier", "payload", "verdict", "attempts"])
+
+
+# =========================
+# LOCAL CHECKS
+# =========================
+def clean_sql(sql):
+    """Strip markdown fences and a trailing semicolon from generated SQL."""
+    sql = re.sub(r"^```(?:sql)?|```$", "", sql.strip(), flags=re.IGNORECASE).strip()
+    return sql.rstrip(";").strip()
+
+
+def _table_refs(masked):
+    """
+    (table, alias) pairs after FROM / JOIN, including comma-separated FROM
+    lists, in query context: the top level or a (SELECT ...) subquery.
+    FROM inside function calls such as
+    EXTRACT(YEAR FROM d) or TRIM(LEADING ' ' FROM s), and IS DISTINCT FROM,
+    do not name tables.
+    """
+    in_query = []
+    stack = [True]
+    for i, ch in enumerate(masked):
+        if ch == "(":
+            stack.append(bool(re.match(r"\s*(SELECT|WITH)\b", masked[i + 1:], re.IGNORECASE)))
+        elif ch == ")" and len(stack) > 1:
+            stack.pop()
+        in_query.append(stack[-1])
+
+    refs = []
+    for m in re.finditer(r"\b(FROM|JOIN)\s+", masked, re.IGNORECASE):
+        if not in_query[m.start()]:
+            continue
+        is_from = m.group(1).upper() == "FROM"
+        if is_from and re.search(r"\bDISTINCT\s+$", masked[:m.start()], re.IGNORECASE):
+            continue
+        pos = m.end()
+        while True:
+            ref = TABLE_REF.match(masked, pos)
+            if not ref:
+                break       # a (SELECT ...) subquery: its own FROM is scanned
+            refs.append((ref.group(1), ref.group(2)))
+            comma = re.compile(r"\s*,\s*").match(masked, ref.end())
+            if not is_from or not comma:
+                break
+            pos = comma.end()
+    return refs
+
+
+def check_sql(sql, table_columns, explain=None):
+    """
+    Cheap checks on generated SQL before trusting it:
+    - parses as one complete SELECT / WITH statement
+    - every table (and alias.column) it references exists in the schema
+    - a dry-run EXPLAIN succeeds, if `explain` is given
+
+    `table_columns` maps lower-case table names to sets of lower-case
+    column names. Returns a Verdict; any failure has confidence 0.
+    """
+    sql = clean_sql(sql)
+    masked = re.sub(r"'(?:[^']|'')*'", "''", sql)
+
+    if not re.match(r"^(SELECT|WITH)\b", masked, re.IGNORECASE):
+        return Verdict(False, 0.0, ["not a SELECT statement"])
+    if ";" in masked:
+        return Verdict(False, 0.0, ["more than one statement"])
+    if masked.count("(") != masked.count(")") or not sqlite3.complete_statement(sql + ";"):
+        return Verdict(False, 0.0, ["does not parse"])
+
+    # Tables after FROM / JOIN, with their aliases
+    ctes = {m.lower() for m in re.findall(r"\b(\w+)\s+AS\s*\(", masked, re.IGNORECASE)}
+    aliases = {}
+    for table, alias in _table_refs(masked):
+        name = table.strip('"').split(".")[-1].lower()
+        if name in ctes:
+            continue
+        if name not in table_columns:
+            return Verdict(False, 0.0, [f"unknown table '{name}'"])
+        aliases[name] = name
+        if alias:
+            aliases[alias.lower()] = name
+
+    for prefix, column in re.findall(r"\b(\w+)\.(\w+)\b", masked):
+        table = aliases.get(prefix.lower())
+        if table and column.lower() not in table_columns[table]:
+            return Verdict(False, 0.0, [f"unknown column '{prefix}.{column}'"])
+
+    if explain is not None:
+        try:
+            explain(sql)
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            return Verdict(False, 0.0, [f"dry run failed: {e}"])
+
+    return Verdict(True, 1.0, [])
+
+
+def check_result(question, columns, rows, verdict=None):
+    """
+    Lower the confidence of a result whose shape does not fit the question
+    (empty, all NULL, several rows for a single-number question, ...).
+    """
+    confidence = verdict.confidence if verdict else 1.0
+    reasons = list(verdict.reasons) if verdict else []
+    rows = list(rows)
+
+    if not rows:
+        confidence -= 0.4
+        reasons.append("empty result")
+    elif all(v is None for r in rows for v in r):
+        confidence -= 0.5
+        reasons.append("only NULL values")
+    else:
+        wants_single = SINGLE_VALUE_WORDS.search(question) and not GROUPING_WORDS.search(question)
+        if wants_single and (len(rows) > 1 or len(columns) > 2):
+            confidence -= 0.3
+            reasons.append("several values for a single-value question")
+
+        top_n = TOP_N.search(question)
+        if top_n and len(rows) != int(top_n.group(1)):
+            confidence -= 0.2
+            reasons.append(f"expected {top_n.group(1)} rows, got {len(rows)}")
+        elif LIST_WORDS.search(question) and not wants_single and len(rows) == 1 and len(columns) == 1:
+            confidence -= 0.2
+            reasons.append("single value for a list question")
+
+    confidence = max(confidence, 0.0)
+    ok = (verdict.ok if verdict else True) and confidence > 0
+    return Verdict(ok, confidence, reasons)
+
+
+# =========================
+# STATS
+# =========================
+class CascadeStats:
+    """Per-tier hit rates and latencies, shared by all sessions."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tiers = {}
+
+    def _tier(self, tier):
+        if tier not in self._tiers:
+            self._tiers[tier] = {
+                "attempts": 0,
+                "accepted": 0,
+                "escalated": 0,
+                "rejected": 0,
+                "timeouts": 0,
+                "confidence_total": 0.0,
+                "latency_total": 0.0,
+                "latencies": deque(maxlen=LATENCY_WINDOW),
+            }
+        return self._tiers[tier]
+
+    def record(self, tier, outcome, seconds, confidence=0.0):
+        """outcome is one of "accepted", "escalated", "rejected", "timeouts"."""
+        with self._lock:
+            t = self._tier(tier)
+            t["attempts"] += 1
+            t[outcome] += 1
+            t["confidence_total"] += confidence
+            t["latency_total"] += seconds
+            t["latencies"].append(seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            out = {}
+            for tier, t in self._tiers.items():
+                latencies = sorted(t["latencies"])
+                attempts = max(t["attempts"], 1)
+                out[tier] = {
+                    "attempts": t["attempts"],
+                    "accepted": t["accepted"],
+                    "escalated": t["escalated"],
+                    "rejected": t["rejected"],
+                    "timeouts": t["timeouts"],
+                    "hit_rate": t["accepted"] / attempts,
+                    "avg_confidence": t["confidence_total"] / attempts,
+                    "avg_latency": t["latency_total"] / attempts,
+                    "p95_latency": latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+                }
+            return out
+
+
+# =========================
+# CASCADE
+# =========================
+class ModelCascade:
+    """
+    Try models from smallest to largest and stop at the first answer that
+    passes the local checks with enough confidence.
+
+    `attempt(tier)` runs one model and returns (payload, Verdict).
+    If every tier falls short, the most confident answer is returned.
+    If the deadline runs out while escalating, the best earlier answer is
+    returned instead of the timeout.
+    """
+
+    def __init__(self, tiers, stats=None, min_confidence=MIN_CONFIDENCE):
+        self.tiers = list(tiers)
+        self.stats = stats or CascadeStats()
+        self.min_confidence = min_confidence
+
+    def run(self, attempt) -> CascadeResult:
+        attempts = []
+        best = None
+        for i, tier in enumerate(self.tiers):
+            last = i == len(self.tiers) - 1
+            start = time.monotonic()
+            try:
+                payload, verdict = attempt(tier)
+            except DeadlineExceeded:
+                self.stats.record(tier, "timeouts", time.monotonic() - start)
+                if best is None:
+                    raise
+                break
+            seconds = time.monotonic() - start
+            attempts.append(Attempt(tier, verdict, seconds))
+
+            accepted = verdict.ok and verdict.confidence >= self.min_confidence
+            if accepted:
+                outcome = "accepted"
+            elif last:
+                outcome = "rejected"    # nothing left to escalate to
+            else:
+                outcome = "escalated"
+            self.stats.record(tier, outcome, seconds, verdict.confidence)
+
+            if best is None or verdict.confidence >= best[2].confidence:
+                best = (tier, payload, verdict)
+            if accepted:
+                return CascadeResult(tier, payload, verdict, attempts)
+
+        tier, payload, verdict = best
+        return CascadeResult(tier, payload, verdict, attempts)
+
+
+def cascade_tiers(model_name, use_cascade=True, small_model=SMALL_MODEL):
+    """Small model first, then the chosen model (no duplicates)."""
+    if not use_cascade or model_name == small_model:
+        return [model_name]
+    return [small_model, model_name]
@@ -0,0 +1,257 @@
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+# =========================
+# CONFIG
+# =========================
+READER_POOL_SIZE = 4
+BUSY_TIMEOUT_MS = 5000
+MAX_WRITE_BATCH = 32     # writes grouped into one transaction
+PROGRESS_OPS = 1000      # VM steps between interrupt checks on reads
+WRITE_TIMEOUT = 30       # seconds a caller waits for its write to commit
+
+# Applied to every connection at open. journal_mode=WAL is persistent in
+# the file, the rest are per connection.
+CONNECTION_PRAGMAS = [
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",      # ~16 MB page cache
+    "PRAGMA mmap_size = 268435456",    # 256 MB
+]
+
+
+class SQLitePool:
+    """
+    Connection manager for one SQLite file shared by all Streamlit sessions.
+
+    - The database is switched to WAL so readers never block the writer
+      and the writer never blocks readers.
+    - Reads borrow a read-only connection from a fixed-size pool.
+    - Writes are queued to a single writer thread, which drains up to
+      MAX_WRITE_BATCH pending statements and commits them together
+      (group commit). Callers block until their statement is committed.
+    """
+
+    def __init__(self, db_path: str, pool_size: int = READER_POOL_SIZE,
+                 max_batch: int = MAX_WRITE_BATCH):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            "reads": 0,
+            "read_wait_total": 0.0,
+            "read_wait_max": 0.0,
+            "read_timeouts": 0,
+            "writes": 0,
+            "write_errors": 0,
+            "write_cancelled": 0,
+            "commits": 0,
+            "write_wait_total": 0.0,
+            "write_wait_max": 0.0,
+            "max_queue_depth": 0,
+        }
+
+        # Writer connection first: it turns on WAL before readers open
+        self._writer_conn = self._open(readonly=False)
+        self._writer_conn.execute("PRAGMA journal_mode = WAL")
+
+        self._readers = queue.Queue()
+        for _ in range(pool_size):
+            self._readers.put(self._open(readonly=True))
+
+        self._writes = queue.Queue()
+        self._closed = False
+        self._writer = threading.Thread(target=self._writer_loop, name="sqlite-writer", daemon=True)
+        self._writer.start()
+
+    def _open(self, readonly: bool):
+        if readonly:
+            uri = f"file:{self.db_path}?mode=ro"
+        else:
+            uri = f"file:{self.db_path}"
+        conn = sqlite3.connect(
+            uri,
+            uri=True,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            isolation_level=None    # transactions are managed explicitly
+        )
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        if readonly:
+            conn.execute("PRAGMA query_only = 1")
+        return conn
+
+    def _record(self, key, value):
+        with self._metrics_lock:
+            self._metrics[key] += value
+            wait_max = key.replace("_total", "_max")
+            if key.endswith("_total") and value > self._metrics[wait_max]:
+                self._metrics[wait_max] = value
+
+    # =========================
+    # READS
+    # =========================
+    def read(self, sql, params=(), interrupt=None, timeout=None):
+        """
+        Run a read-only statement on a pooled connection and return all rows.
+        `interrupt` is polled while the query runs; when it returns True the
+        query is aborted with sqlite3.OperationalError("interrupted").
+        `timeout` bounds the wait for a free connection (TimeoutError).
+        """
+        return self.query(sql, params, interrupt, timeout)[1]
+
+    def query(self, sql, params=(), interrupt=None, timeout=None):
+        """Same as read(), but returns (column_names, rows)."""
+        start = time.perf_counter()
+        try:
+            conn = self._readers.get(timeout=None if timeout is None else max(timeout, 0))
+        except queue.Empty:
+            self._record("read_timeouts", 1)
+            raise TimeoutError(f"No reader connection free within {timeout:.1f}s") from None
+        self._record("read_wait_total", time.perf_counter() - start)
+        try:
+            if interrupt is not None:
+                conn.set_progress_handler(lambda: 1 if interrupt() else 0, PROGRESS_OPS)
+            cur = conn.execute(sql, params)
+            columns = [d[0] for d in cur.description or []]
+            rows = cur.fetchall()
+        finally:
+            if interrupt is not None:
+                conn.set_progress_handler(None, 0)
+            self._readers.put(conn)
+        self._record("reads", 1)
+        return columns, rows
+
+    # =========================
+    # WRITES
+    # =========================
+    def write(self, sql, params=(), timeout=WRITE_TIMEOUT):
+        """
+        Queue a write for the single writer and wait until it is committed.
+        Returns the number of affected rows.
+
+        If the writer has not started the job within `timeout` it is
+        cancelled and TimeoutError is raised, so a write reported as failed
+        never commits later. A job already being committed is waited for.
+        """
+        if self._closed:
+            raise RuntimeError("Pool is closed")
+        future = Future()
+        self._writes.put((sql, params, future, time.perf_counter()))
+        depth = self._writes.qsize()
+        with self._metrics_lock:
+            if depth > self._metrics["max_queue_depth"]:
+                self._metrics["max_queue_depth"] = depth
+        try:
+            return future.result(timeout=max(timeout, 0))
+        except TimeoutError:
+            if future.cancel():
+                self._record("write_cancelled", 1)
+                raise TimeoutError(f"Write not started within {timeout:.1f}s; cancelled")
+            # The writer picked it up just now: report the real outcome
+            return future.result()
+
+    def _writer_loop(self):
+        while True:
+            job = self._writes.get()
+            if job is None:
+                return
+            batch = [job]
+            while len(batch) < self.max_batch:
+                try:
+                    job = self._writes.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    self._safe_commit(batch)
+                    return
+                batch.append(job)
+            self._safe_commit(batch)
+
+    def _safe_commit(self, batch):
+        # Savepoint / rollback failures must not kill the writer thread,
+        # or every later write would hang until its timeout
+        try:
+            self._commit_batch(batch)
+        except Exception as e:
+            try:
+                if self._writer_conn.in_transaction:
+                    self._writer_conn.execute("ROLLBACK")
+            except Exception:
+                pass
+            for _, _, future, _ in batch:
+                if not future.done():
+                    self._record("write_errors", 1)
+                    future.set_exception(e)
+
+    def _commit_batch(self, batch):
+        conn = self._writer_conn
+        results = []
+
+        # Skip jobs whose callers timed out and cancelled them; the rest
+        # can no longer be cancelled
+        batch = [job for job in batch if job[2].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except Exception as e:
+            # Could not get the write lock even after busy_timeout
+            for _, _, future, _ in batch:
+                self._record("write_errors", 1)
+                future.set_exception(e)
+            return
+
+        for sql, params, future, queued_at in batch:
+            self._record("write_wait_total", time.perf_counter() - queued_at)
+            # A savepoint per statement keeps one bad write from
+            # rolling back the rest of the group
+            conn.execute("SAVEPOINT write_job")
+            try:
+                cur = conn.execute(sql, params)
+                conn.execute("RELEASE write_job")
+                results.append((future, cur.rowcount, None))
+            except Exception as e:
+                conn.execute("ROLLBACK TO write_job")
+                conn.execute("RELEASE write_job")
+                results.append((future, None, e))
+
+        try:
+            conn.execute("COMMIT")
+        except Exception as e:
+            conn.execute("ROLLBACK")
+            results = [(future, None, e) for future, _, _ in results]
+
+        self._record("commits", 1)
+        for future, rowcount, error in results:
+            if error is None:
+                self._record("writes", 1)
+                future.set_result(rowcount)
+            else:
+                self._record("write_errors", 1)
+                future.set_exception(error)
+
+    # =========================
+    # METRICS / LIFECYCLE
+    # =========================
+    def metrics(self) -> dict:
+        with self._metrics_lock:
+            snapshot = dict(self._metrics)
+        snapshot["queue_depth"] = self._writes.qsize()
+        snapshot["idle_readers"] = self._readers.qsize()
+        snapshot["read_wait_avg"] = snapshot["read_wait_total"] / max(snapshot["reads"], 1)
+        snapshot["write_wait_avg"] = snapshot["write_wait_total"] / max(snapshot["writes"] + snapshot["write_errors"], 1)
+        return snapshot
+
+    def close(self):
+        self._closed = True
+        self._writes.put(None)
+        self._writer.join()
+        self._writer_conn.close()
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
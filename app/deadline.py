@@ -0,0 +1,142 @@
+import contextvars
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+# =========================
+# CONFIG
+# =========================
+REQUEST_BUDGET = 30.0    # seconds for one question, end to end
+
+_current = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request runs out of its time budget."""
+
+    def __init__(self, stage, partial=None):
+        self.stage = stage
+        self.partial = partial
+        super().__init__(f"Deadline exceeded during '{stage}'")
+
+
+class Deadline:
+    """
+    Time budget for one request, shared by every stage of the pipeline
+    (routing, LLM generation, SQL execution).
+
+    Stages are entered with `with deadline.stage("llm"): ...`; the time
+    spent in each one is recorded so a timeout can say where it went.
+    """
+
+    def __init__(self, budget: float = REQUEST_BUDGET):
+        self.budget = budget
+        self.started = time.monotonic()
+        self.timings = {}
+        self.current_stage = None
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def remaining(self) -> float:
+        return max(self.budget - self.elapsed(), 0.0)
+
+    def expired(self) -> bool:
+        return self.elapsed() >= self.budget
+
+    def check(self, partial=None):
+        if self.expired():
+            raise DeadlineExceeded(self.current_stage or "request", partial)
+
+    def add_time(self, stage, seconds):
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name):
+        previous = self.current_stage
+        self.current_stage = name
+        token = _current.set(self)
+        start = time.monotonic()
+        try:
+            self.check()
+            yield self
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            # Interrupted queries / aborted streams surface as driver
+            # errors; report them as a timeout if the budget is spent
+            if self.expired():
+                raise DeadlineExceeded(name) from e
+            raise
+        finally:
+            self.add_time(name, time.monotonic() - start)
+            _current.reset(token)
+            self.current_stage = previous
+
+    def report(self) -> dict:
+        return {
+            "budget": self.budget,
+            "elapsed": round(self.elapsed(), 3),
+            "timings": {k: round(v, 3) for k, v in self.timings.items()},
+        }
+
+
+def current_deadline():
+    """Deadline of the stage currently running, if any."""
+    return _current.get()
+
+
+# =========================
+# LLM
+# =========================
+def stream_llm(llm, prompt, deadline=None):
+    """
+    Stream a completion and stop as soon as the deadline passes.
+    On timeout the text generated so far is attached to the exception.
+    """
+    deadline = deadline or current_deadline()
+    chunks = []
+    stream = llm.stream(prompt)
+    try:
+        for chunk in stream:
+            # Ollama may yield str or message chunks
+            chunks.append(chunk if isinstance(chunk, str) else chunk.content)
+            if deadline and deadline.expired():
+                raise DeadlineExceeded(deadline.current_stage or "llm", "".join(chunks))
+    finally:
+        # Closing the generator drops the HTTP stream, cancelling generation
+        close = getattr(stream, "close", None)
+        if close:
+            close()
+    return "".join(chunks)
+
+
+# =========================
+# SQL
+# =========================
+def install_sql_timeouts(engine):
+    """
+    Enforce the current deadline on every statement run through a
+    SQLAlchemy engine:
+    - SQLite: a progress handler interrupts the query
+    - PostgreSQL: statement_timeout is set to the remaining budget
+    """
+    dialect = engine.dialect.name
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _apply_deadline(conn, cursor, statement, parameters, context, executemany):
+        deadline = current_deadline()
+        if deadline is not None:
+            deadline.check()
+
+        if dialect == "sqlite":
+            # Set (or clear) on every statement so a handler never outlives its request
+            handler = None
+            if deadline is not None:
+                handler = lambda: 1 if deadline.expired() else 0
+            conn.connection.driver_connection.set_progress_handler(handler, 1000)
+        elif dialect == "postgresql" and deadline is not None:
+            # SET LOCAL ends with the surrounding transaction
+            ms = max(int(deadline.remaining() * 1000), 1)
+            cursor.execute(f"SET LOCAL statement_timeout = {ms}")
@@ -0,0 +1,184 @@
+import os
+import sqlite3
+import time
+from collections import deque, namedtuple
+
+# =========================
+# CONFIG
+# =========================
+HISTORY_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chat_history.db")
+RECENT_LIMIT = 20        # turns kept in memory and rendered on every rerun
+PAGE_SIZE = 10           # older turns rendered per page
+PREVIEW_CHARS = 2000     # answers longer than this are stored as previews
+RETENTION_DAYS = 30      # turns older than this are deleted when a store opens
+MAX_SESSION_TURNS = 500  # oldest turns beyond this are deleted per session
+
+HistoryEntry = namedtuple(
+    "HistoryEntry",
+    ["id", "question", "preview", "elapsed", "truncated"]
+)
+
+
+def make_preview(answer, limit=PREVIEW_CHARS):
+    """Return (preview, truncated) for an answer string."""
+    answer = str(answer)
+    if len(answer) <= limit:
+        return answer, False
+    return answer[:limit].rstrip() + " …", True
+
+
+class HistoryStore:
+    """
+    Chat history for one UI session.
+
+    Every turn is written to a local SQLite table. Only the last
+    `recent_limit` turns (with truncated answers) stay in memory, so the
+    cost of a Streamlit rerun does not grow with the session length.
+    Older turns are read back page by page and full answers on demand.
+    """
+
+    def __init__(self, session_id: str, db_path: str = HISTORY_DB_PATH,
+                 recent_limit: int = RECENT_LIMIT, preview_chars: int = PREVIEW_CHARS):
+        self.session_id = session_id
+        self.db_path = db_path
+        self.preview_chars = preview_chars
+        self.recent = deque(maxlen=recent_limit)
+        self._appends = 0
+        self._create_table()
+        self._prune()
+        self._load_recent()
+
+    def _connect(self):
+        # Streamlit reruns may land on different threads, so a short-lived
+        # connection per call is simpler than sharing one.
+        return sqlite3.connect(self.db_path, timeout=5)
+
+    def _create_table(self):
+        with self._connect() as conn:
+            conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chat_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                question TEXT,
+                preview TEXT,
+                answer TEXT,
+                truncated INTEGER,
+                elapsed REAL,
+                created_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_chat_history_session
+                ON chat_history (session_id, id);
+            CREATE INDEX IF NOT EXISTS idx_chat_history_created
+                ON chat_history (created_at);
+            """)
+
+    def _prune(self):
+        """
+        Keep the file bounded: drop turns past the retention window (old
+        browser sessions are never read again) and cap this session's size.
+        """
+        cutoff = time.time() - RETENTION_DAYS * 86400
+        with self._connect() as conn:
+            conn.execute("DELETE FROM chat_history WHERE created_at < ?", (cutoff,))
+            conn.execute(
+                """
+                DELETE FROM chat_history
+                WHERE session_id = ? AND id NOT IN (
+                    SELECT id FROM chat_history
+                    WHERE session_id = ?
+                    ORDER BY id DESC
+                    LIMIT ?
+                )
+                """,
+                (self.session_id, self.session_id, MAX_SESSION_TURNS)
+            )
+
+    def _load_recent(self):
+        with self._connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT id, question, preview, elapsed, truncated
+                FROM chat_history
+                WHERE session_id = ?
+                ORDER BY id DESC
+                LIMIT ?
+                """,
+                (self.session_id, self.recent.maxlen)
+            ).fetchall()
+        for row in reversed(rows):
+            self.recent.append(HistoryEntry(row[0], row[1], row[2], row[3], bool(row[4])))
+
+    # =========================
+    # WRITE
+    # =========================
+    def append(self, question, answer, elapsed):
+        preview, truncated = make_preview(answer, self.preview_chars)
+        with self._connect() as conn:
+            cur = conn.execute(
+                """
+                INSERT INTO chat_history
+                    (session_id, question, preview, answer, truncated, elapsed, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (self.session_id, question, preview, str(answer),
+                 int(truncated), elapsed, time.time())
+            )
+            entry = HistoryEntry(cur.lastrowid, question, preview, elapsed, truncated)
+        self.recent.append(entry)
+        # Long-lived sessions prune too, not only on open
+        self._appends += 1
+        if self._appends % 50 == 0:
+            self._prune()
+        return entry
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM chat_history WHERE session_id = ?", (self.session_id,))
+        self.recent.clear()
+
+    # =========================
+    # READ
+    # =========================
+    def count(self) -> int:
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM chat_history WHERE session_id = ?",
+                (self.session_id,)
+            ).fetchone()[0]
+
+    def older_count(self) -> int:
+        """Number of turns that are no longer held in memory."""
+        return max(self.count() - len(self.recent), 0)
+
+    def older_page(self, page: int, page_size: int = PAGE_SIZE):
+        """
+        Page through turns older than the in-memory buffer.
+        Page 0 holds the turns just before the buffer; entries are
+        returned oldest first so they render in chat order.
+        """
+        if not self.recent:
+            return []
+        oldest_recent = self.recent[0].id
+        with self._connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT id, question, preview, elapsed, truncated
+                FROM chat_history
+                WHERE session_id = ? AND id < ?
+                ORDER BY id DESC
+                LIMIT ? OFFSET ?
+                """,
+                (self.session_id, oldest_recent, page_size, page * page_size)
+            ).fetchall()
+        return [
+            HistoryEntry(r[0], r[1], r[2], r[3], bool(r[4]))
+            for r in reversed(rows)
+        ]
+
+    def full_answer(self, entry_id: int) -> str:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT answer FROM chat_history WHERE id = ? AND session_id = ?",
+                (entry_id, self.session_id)
+            ).fetchone()
+        return row[0] if row else ""
@@ -0,0 +1,217 @@
+import datetime
+import re
+from decimal import Decimal
+
+# =========================
+# CONFIG
+# =========================
+MAX_TABLE_ROWS = 20
+MAX_LIST_ITEMS = 15
+MAX_COLUMNS = 6          # wider results are left to the (optional) LLM
+TOP_K = 3
+
+# Whole words only ("rate" must not match "generated"), but "_" separates
+# words too so column names like selling_price still match
+MONEY_WORDS = re.compile(r"(?<![a-z])(revenue|sales|price|cost|profit|amount|spend|income|value|aov)s?(?![a-z])|₹", re.IGNORECASE)
+PERCENT_WORDS = re.compile(r"(?<![a-z])(percent|pct|margin|rate|ratio|share)s?(?![a-z])|%", re.IGNORECASE)
+COUNT_WORDS = re.compile(r"(?<![a-z])(count|number|how many|total_(users|orders|items)|qty|quantity|units?)s?(?![a-z])", re.IGNORECASE)
+TIME_WORDS = re.compile(r"(?<![a-z])(date|day|week|month|quarter|year|period|time)s?(?![a-z])", re.IGNORECASE)
+DATE_VALUE = re.compile(r"^\d{4}(-\d{2}){0,2}([ T].*)?$")
+
+
+# =========================
+# VALUE HELPERS
+# =========================
+def _is_number(v):
+    return isinstance(v, (int, float, Decimal)) and not isinstance(v, bool)
+
+
+def _kind(column, question="", values=()):
+    """
+    Classify a numeric column as money, percent, count or plain number.
+    The column name decides first, then the question: "how many ..." is a
+    count even if it mentions revenue. Integer-valued results with no
+    other hint are counts.
+    """
+    name = column or ""
+    if PERCENT_WORDS.search(name):
+        return "percent"
+    if MONEY_WORDS.search(name):
+        return "money"
+    if COUNT_WORDS.search(name) or name.upper().startswith("COUNT("):
+        return "count"
+    # Expression columns like SUM(...) carry no name: use the question
+    if COUNT_WORDS.search(question):
+        return "count"
+    if PERCENT_WORDS.search(question):
+        return "percent"
+    if MONEY_WORDS.search(question):
+        return "money"
+    numbers = [v for v in values if _is_number(v)]
+    if numbers and all(isinstance(v, int) for v in numbers):
+        return "count"
+    return "number"
+
+
+def format_value(v, kind="number"):
+    if v is None:
+        return "–"
+    if not _is_number(v):
+        return str(v)
+    v = float(v) if isinstance(v, Decimal) else v
+    if kind == "money":
+        return f"₹{v:,.2f}"
+    if kind == "percent":
+        return f"{round(float(v), 2)}%"
+    if isinstance(v, int) or (kind == "count" and float(v).is_integer()):
+        return f"{int(v):,}"
+    return f"{v:,.2f}"
+
+
+def label(column):
+    """Readable column label; expression columns become 'Result'."""
+    if not column or "(" in column:
+        return "Result"
+    return column.split(".")[-1].replace("_", " ").strip().capitalize()
+
+
+def _is_time_column(column, values):
+    if TIME_WORDS.search(column or ""):
+        return True
+    return all(
+        isinstance(v, (datetime.date, datetime.datetime))
+        or (isinstance(v, str) and DATE_VALUE.match(v))
+        for v in values
+    )
+
+
+# =========================
+# SHAPES
+# =========================
+def to_table(columns, rows, question="", limit=MAX_TABLE_ROWS):
+    kinds = []
+    for i, col in enumerate(columns):
+        numeric = any(_is_number(r[i]) for r in rows)
+        kinds.append(_kind(col, question, [r[i] for r in rows]) if numeric else "text")
+
+    lines = [
+        "| " + " | ".join(label(c) if "(" not in c else c for c in columns) + " |",
+        "| " + " | ".join("---" for _ in columns) + " |",
+    ]
+    for row in rows[:limit]:
+        lines.append("| " + " | ".join(format_value(v, k) for v, k in zip(row, kinds)) + " |")
+    if len(rows) > limit:
+        lines.append(f"\n… and {len(rows) - limit:,} more rows")
+    return "\n".join(lines)
+
+
+def _scalar(question, column, value):
+    kind = _kind(column, question, [value]) if _is_number(value) else "text"
+    return f"**{label(column)}:** {format_value(value, kind)}"
+
+
+def _single_row(question, columns, row):
+    lines = []
+    for col, v in zip(columns, row):
+        kind = _kind(col, question, [v]) if _is_number(v) else "text"
+        lines.append(f"- **{label(col)}:** {format_value(v, kind)}")
+    return "\n".join(lines)
+
+
+def _single_column(columns, rows):
+    values = [str(r[0]) for r in rows]
+    shown = ", ".join(values[:MAX_LIST_ITEMS])
+    more = f" and {len(values) - MAX_LIST_ITEMS:,} more" if len(values) > MAX_LIST_ITEMS else ""
+    return f"**{len(values):,} {label(columns[0]).lower()} values:** {shown}{more}"
+
+
+def _time_series(question, columns, rows, value_index):
+    col = columns[value_index]
+    kind = _kind(col, question, [r[value_index] for r in rows])
+    points = [(r[0], r[value_index]) for r in rows if _is_number(r[value_index])]
+    if len(points) < 2:
+        return None
+
+    (first_t, first_v), (last_t, last_v) = points[0], points[-1]
+    peak_t, peak_v = max(points, key=lambda p: p[1])
+    low_t, low_v = min(points, key=lambda p: p[1])
+
+    change = ""
+    if first_v:
+        pct = (float(last_v) - float(first_v)) * 100 / abs(float(first_v))
+        change = f" ({pct:+.1f}%)"
+
+    return (
+        f"**{label(col)}** went from {format_value(first_v, kind)} ({first_t}) "
+        f"to {format_value(last_v, kind)} ({last_t}){change}. "
+        f"Peak {format_value(peak_v, kind)} in {peak_t}, "
+        f"lowest {format_value(low_v, kind)} in {low_t}."
+    )
+
+
+def _top_k(question, columns, rows, label_index, value_index):
+    values = [r[value_index] for r in rows if _is_number(r[value_index])]
+    kind = _kind(columns[value_index], question, values)
+    descending = all(float(a) >= float(b) for a, b in zip(values, values[1:]))
+    ascending = all(float(a) <= float(b) for a, b in zip(values, values[1:]))
+
+    top = ", ".join(
+        f"**{r[label_index]}** ({format_value(r[value_index], kind)})"
+        for r in rows[:TOP_K]
+    )
+    if descending:
+        head = f"Highest {label(columns[value_index]).lower()}: {top}"
+    elif ascending:
+        head = f"Lowest {label(columns[value_index]).lower()}: {top}"
+    else:
+        head = f"{len(rows):,} {label(columns[label_index]).lower()} rows, first: {top}"
+    return head
+
+
+def summarize(question, columns, rows):
+    """
+    Turn a typed query result into a short markdown answer without an LLM.
+
+    Rules are keyed on the result shape: empty, scalar, single row,
+    single column list, time series and ranked / grouped values.
+    Returns None for shapes these rules do not cover.
+    """
+    columns = [str(c) for c in columns]
+    rows = [tuple(r) for r in rows]
+
+    if not rows:
+        return "No matching rows found."
+    if len(columns) > MAX_COLUMNS:
+        return None
+    if any(isinstance(v, (bytes, dict, list)) for r in rows for v in r):
+        return None
+
+    if len(rows) == 1 and len(columns) == 1:
+        return _scalar(question, columns[0], rows[0][0])
+    if len(rows) == 1:
+        return _single_row(question, columns, rows[0])
+    if len(columns) == 1:
+        return _single_column(columns, rows)
+
+    numeric = [i for i in range(len(columns)) if all(_is_number(r[i]) or r[i] is None for r in rows)]
+    labels = [i for i in range(len(columns)) if i not in numeric]
+    table = to_table(columns, rows, question)
+
+    # Time series: first column is a date / period, the rest numeric
+    if 0 not in numeric or TIME_WORDS.search(columns[0]):
+        if _is_time_column(columns[0], [r[0] for r in rows]):
+            value_index = next((i for i in range(1, len(columns)) if i in numeric), None)
+            if value_index is not None:
+                text = _time_series(question, columns, rows, value_index)
+                if text:
+                    return f"{text}\n\n{table}"
+
+    # Ranked / grouped values: one label column, numeric measures
+    if len(labels) == 1 and numeric:
+        return f"{_top_k(question, columns, rows, labels[0], numeric[0])}\n\n{table}"
+
+    # Any other narrow result: just the table
+    if len(columns) <= MAX_COLUMNS and labels:
+        return f"**{len(rows):,} rows**\n\n{table}"
+
+    return None
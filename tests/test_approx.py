@@ -0,0 +1,141 @@
+import random
+import sqlite3
+
+import pytest
+
+from approx import Estimate, SampleStore, _estimate, approximate, plan_approx
+
+
+# =========================
+# plan_approx
+# =========================
+def test_plan_accepts_dimension_joins():
+    plan = plan_approx("""
+        SELECT u.city, AVG(p.selling_price * oi.quantity) AS avg_value
+        FROM order_items oi
+        JOIN orders o ON oi.order_id = o.order_id
+        JOIN users u ON o.user_id = u.user_id
+        JOIN products p ON oi.product_id = p.product_id
+        GROUP BY u.city
+        ORDER BY avg_value DESC
+    """)
+    assert plan.table == "order_items"
+    assert plan.columns == ["city", "avg_value"]
+    assert "__s1" in plan.sql and "__q1" in plan.sql and "__c1" in plan.sql
+    assert plan.order_by == [(1, True)]
+
+
+@pytest.mark.parametrize("sql", [
+    # fan-out: one order row per item
+    "SELECT COUNT(*) FROM orders o JOIN order_items oi ON oi.order_id = o.order_id",
+    # fact table is not the FROM table
+    "SELECT COUNT(o.order_id) FROM users u JOIN orders o ON u.user_id = o.user_id",
+    # outer / cross / comma joins
+    "SELECT COUNT(o.order_id) FROM users u LEFT JOIN orders o ON u.user_id = o.user_id",
+    "SELECT COUNT(*) FROM orders o LEFT JOIN users u ON u.user_id = o.user_id",
+    "SELECT COUNT(*) FROM orders o CROSS JOIN users u",
+    "SELECT COUNT(*) FROM orders o, users u WHERE u.user_id = o.user_id",
+])
+def test_plan_rejects_joins_that_break_scaling(sql):
+    assert plan_approx(sql) is None
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM orders",
+    "SELECT MAX(order_id) FROM orders",
+    "SELECT COUNT(DISTINCT user_id) FROM orders",
+    "SELECT user_id, COUNT(*) FROM orders GROUP BY 1",
+    "SELECT SUM(quantity) * 2 FROM order_items",
+    "DELETE FROM orders",
+])
+def test_plan_rejects_unsupported_queries(sql):
+    assert plan_approx(sql) is None
+
+
+# =========================
+# _estimate
+# =========================
+def test_estimate_zero_hits_has_no_spread():
+    # Nothing matched: the estimate alone cannot tell 0 from "rare"
+    est = _estimate("COUNT", 0, 0, 0, 2000, 40000)
+    assert est.value == 0 and est.low == est.high == 0
+
+
+def test_estimate_avg_of_single_row_has_no_spread():
+    est = _estimate("AVG", 3, 9, 1, 2000, 40000)
+    assert est.value == 3 and est.low == est.high
+
+
+def test_estimate_scales_count_with_interval():
+    est = _estimate("COUNT", 500, 500, 500, 1000, 10000)
+    assert est.value == pytest.approx(5000)
+    assert est.low < 5000 < est.high
+
+
+def test_estimate_is_exact_for_full_sample():
+    est = _estimate("SUM", 10.0, 30.0, 5, 100, 100)
+    assert est.value == pytest.approx(10.0)
+    assert est.low == est.high == pytest.approx(10.0)
+
+
+def test_estimate_rejects_fan_out_sums():
+    # More counted rows than sampled rows: q < s*s/n
+    assert _estimate("COUNT", 30, 30, 30, 10, 100) is None
+
+
+def test_estimate_always_shows_interval():
+    assert str(Estimate(5.0, 5.0, 5.0)) == "5.00 ± 0.00"
+    assert str(Estimate(None, None, None)) == "–"
+
+
+# =========================
+# approximate
+# =========================
+@pytest.fixture
+def store(tmp_path):
+    db_path = str(tmp_path / "business.db")
+    rng = random.Random(0)
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE users (user_id INTEGER PRIMARY KEY, name TEXT);
+        CREATE TABLE order_items (
+            item_id INTEGER PRIMARY KEY, order_id INTEGER, user_id INTEGER, quantity INTEGER
+        );
+    """)
+    conn.executemany("INSERT INTO users VALUES (?, ?)", [(i, f"User{i}") for i in range(500)])
+    conn.executemany(
+        "INSERT INTO order_items (order_id, user_id, quantity) VALUES (?, ?, ?)",
+        [(i // 2, rng.randrange(500), rng.randint(1, 3)) for i in range(40000)]
+    )
+    conn.commit()
+    conn.close()
+
+    store = SampleStore(db_path, str(tmp_path / "samples"), fact_tables=["order_items"], sample_size=4000)
+    store.refresh()
+    return store
+
+
+def test_approximate_scales_up_total(store):
+    result = approximate(store, "SELECT COUNT(*) AS items FROM order_items")
+    (est,), = result.rows
+    assert est.low <= 40000 <= est.high
+    assert "±" in str(est)
+
+
+def test_approximate_falls_back_on_zero_hits(store):
+    assert approximate(store, "SELECT COUNT(*) FROM order_items WHERE order_id = 1") is None
+
+
+def test_approximate_falls_back_on_few_rows(store):
+    assert approximate(store, "SELECT AVG(quantity) FROM order_items WHERE order_id < 20") is None
+
+
+def test_approximate_falls_back_on_high_cardinality_groups(store):
+    sql = """
+        SELECT u.name, SUM(oi.quantity) AS units
+        FROM order_items oi
+        JOIN users u ON oi.user_id = u.user_id
+        GROUP BY u.name
+        ORDER BY units DESC
+    """
+    assert approximate(store, sql) is None
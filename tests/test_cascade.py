@@ -0,0 +1,96 @@
+import pytest
+
+from cascade import ModelCascade, Verdict, check_result, check_sql
+
+TABLES = {
+    "users": {"user_id", "name", "city", "signup_date"},
+    "orders": {"order_id", "user_id", "order_date"},
+    "order_items": {"item_id", "order_id", "product_id", "quantity"},
+}
+
+
+# =========================
+# check_sql
+# =========================
+@pytest.mark.parametrize("sql", [
+    "SELECT u.city, COUNT(*) FROM users u JOIN orders o ON o.user_id = u.user_id GROUP BY u.city",
+    "SELECT COUNT(*) FROM users AS u, orders AS o WHERE o.user_id = u.user_id",
+    "SELECT EXTRACT(YEAR FROM o.order_date) AS y, COUNT(*) FROM orders o GROUP BY y",
+    "SELECT TRIM(LEADING ' ' FROM u.name) FROM users u",
+    "SELECT SUBSTRING(u.city FROM 1 FOR 3) FROM users u",
+    "SELECT * FROM users u WHERE u.city IS DISTINCT FROM u.name",
+    "WITH recent AS (SELECT * FROM orders) SELECT COUNT(*) FROM recent",
+    "```sql\nSELECT name FROM users;\n```",
+])
+def test_check_sql_accepts_valid_queries(sql):
+    assert check_sql(sql, TABLES) == Verdict(True, 1.0, [])
+
+
+@pytest.mark.parametrize("sql, reason", [
+    ("SELECT * FROM users JOIN bogus ON 1 = 1", "unknown table 'bogus'"),
+    ("SELECT * FROM users u JOIN bogus b ON b.id = u.user_id", "unknown table 'bogus'"),
+    ("SELECT * FROM users, bogus", "unknown table 'bogus'"),
+    ("SELECT * FROM users u, orders o, bogus WHERE 1 = 1", "unknown table 'bogus'"),
+    ("SELECT * FROM (SELECT user_id FROM bogus) x", "unknown table 'bogus'"),
+    ("SELECT u.bogus FROM users u", "unknown column 'u.bogus'"),
+    ("DELETE FROM users", "not a SELECT statement"),
+    ("SELECT 1; SELECT 2", "more than one statement"),
+    ("SELECT COUNT(* FROM users", "does not parse"),
+])
+def test_check_sql_rejects(sql, reason):
+    verdict = check_sql(sql, TABLES)
+    assert not verdict.ok and verdict.confidence == 0.0
+    assert verdict.reasons == [reason]
+
+
+def test_check_sql_dry_run_failure():
+    def explain(sql):
+        raise ValueError("no such function: FOO")
+
+    verdict = check_sql("SELECT FOO(name) FROM users", TABLES, explain=explain)
+    assert not verdict.ok
+    assert verdict.reasons == ["dry run failed: no such function: FOO"]
+
+
+# =========================
+# check_result
+# =========================
+def test_check_result_fitting_shape():
+    assert check_result("how many users are there", ["COUNT(*)"], [(500,)]) == Verdict(True, 1.0, [])
+
+
+def test_check_result_empty():
+    verdict = check_result("list users in Pune", ["name"], [])
+    assert verdict.ok and verdict.confidence == pytest.approx(0.6)
+    assert verdict.reasons == ["empty result"]
+
+
+def test_check_result_only_nulls():
+    verdict = check_result("average order value", ["AVG(x)"], [(None,)])
+    assert verdict.confidence == pytest.approx(0.5)
+    assert verdict.reasons == ["only NULL values"]
+
+
+def test_check_result_several_values_for_single_value_question():
+    verdict = check_result("how many users are there", ["city", "n"], [("Pune", 3), ("Delhi", 4)])
+    assert verdict.confidence == pytest.approx(0.7)
+
+
+def test_check_result_top_n_mismatch():
+    verdict = check_result("top 5 cities by revenue", ["city", "revenue"], [("Pune", 1.0)] * 3)
+    assert verdict.reasons == ["expected 5 rows, got 3"]
+
+
+def test_check_result_keeps_failed_sql_verdict():
+    verdict = check_result("list users", ["name"], [("a",), ("b",)], Verdict(False, 0.0, ["bad"]))
+    assert not verdict.ok and verdict.confidence == 0.0
+
+
+# =========================
+# ModelCascade
+# =========================
+def test_cascade_escalates_until_confident():
+    verdicts = {"small": Verdict(True, 0.4, ["weak"]), "large": Verdict(True, 0.9, [])}
+    result = ModelCascade(["small", "large"]).run(lambda tier: (tier, verdicts[tier]))
+    assert result.tier == "large"
+    assert [a.tier for a in result.attempts] == ["small", "large"]
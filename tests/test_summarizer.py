@@ -0,0 +1,26 @@
+import pytest
+
+from summarizer import _kind, summarize
+
+
+@pytest.mark.parametrize("column, question, values, kind", [
+    ("COUNT(*)", "how many orders have revenue above 1000", [12], "count"),
+    ("SUM(x)", "what is the total revenue", [1000], "money"),
+    ("SUM(x)", "what share of orders shipped late", [0.25], "percent"),
+    ("SUM(oi.quantity)", "units sold last year", [250], "count"),
+    ("n", "which users generated orders", [5], "count"),
+    ("x", "which users generated orders", [3.5], "number"),
+    ("x", "which users shared a cart", [3.5], "number"),
+    ("selling_price", "list products", [10.0], "money"),
+    ("profit_margin", "", [0.2], "percent"),
+])
+def test_kind(column, question, values, kind):
+    assert _kind(column, question, values) == kind
+
+
+def test_integer_revenue_stays_money():
+    assert summarize("what is the total revenue", ["SUM(x)"], [(1000,)]) == "**Result:** ₹1,000.00"
+
+
+def test_count_question_mentioning_revenue():
+    assert summarize("how many orders have revenue above 1000", ["COUNT(*)"], [(1234,)]) == "**Result:** 1,234"
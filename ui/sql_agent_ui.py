@@ -1,11 +1,22 @@
 import streamlit as st
-from langchain_community.utilities import SQLDatabase
-from langchain_community import OllamaLLM
-from langchain_community.agent_toolkits import create_sql_agent
-# from langchain.agents.agent_types import AgentType
 import pandas as pd
 import time
 import re
+import os
+import sys
+import uuid
+
+# Shared backend modules live in app/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+from history_store import HistoryStore, PAGE_SIZE
+from agent import SQLAgentService
+from deadline import REQUEST_BUDGET
+from cascade import CascadeStats, SMALL_MODEL
+
+# Cascade hit rates / latency are shared by all sessions
+@st.cache_resource
+def get_cascade_stats():
+    return CascadeStats()
 
 # Set up the page
 st.set_page_config(
@@ -16,8 +27,12 @@ st.set_page_config(
 )
 
 # Initialize session state
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
 if 'history' not in st.session_state:
-    st.session_state.history = []
+    st.session_state.history = HistoryStore(st.session_state.session_id)
+if 'history_page' not in st.session_state:
+    st.session_state.history_page = 0
 if 'agent' not in st.session_state:
     st.session_state.agent = None
 if 'db_connected' not in st.session_state:
@@ -50,30 +65,32 @@ with st.sidebar:
     max_iterations = st.slider("Max Agent Iterations", min_value=3, max_value=15, value=5, 
                               help="Limit the number of reasoning steps to prevent long runs")
     
+    # Try the small model first and escalate only when its SQL fails local checks
+    use_cascade = st.checkbox(f"Small-model-first cascade ({SMALL_MODEL} first)", value=True,
+                              help=f"Questions go to {SMALL_MODEL} first; the selected model is used only when needed")
+    
+    # Results are summarized locally; the LLM is only asked about unusual shapes
+    llm_explain = st.checkbox("LLM explanation for unusual results", value=False,
+                              help="Adds a second LLM call when a result does not fit the built-in summaries")
+    
+    # Hard deadline for a whole question (LLM calls + SQL execution)
+    time_budget = st.slider("Time Budget (seconds)", min_value=5, max_value=120, value=int(REQUEST_BUDGET),
+                            help="Questions that run longer are cancelled and return what they have so far")
+    
     if st.button("Initialize Agent"):
         with st.spinner("Connecting to database and initializing agent..."):
             try:
-                # Initialize database connection
-                st.session_state.db = SQLDatabase.from_uri(db_url)
+                # Initialize database connection, LLM and agent (with deadline enforcement)
+                service = SQLAgentService(db_url, model_name, max_iterations,
+                                          budget=time_budget, llm_explain=llm_explain,
+                                          use_cascade=use_cascade, cascade_stats=get_cascade_stats())
+                service.initialize()
+                st.session_state.agent = service
+                st.session_state.db = service.db
                 
                 # Get table names for quick access
                 st.session_state.table_names = st.session_state.db.get_usable_table_names()
                 
-                # Initialize LLM
-                llm = OllamaLLM(model=model_name, temperature=0)
-                
-                # Create agent with the correct agent type
-                st.session_state.agent = create_sql_agent(
-    llm=llm,
-    db=st.session_state.db,
-    verbose=True,
-    handle_parsing_errors=True,
-    max_iterations=max_iterations,
-    early_stopping_method="force",
-    top_k=10
-)
-
-                
                 st.session_state.db_connected = True
                 st.success("Agent initialized successfully!")
                 
@@ -157,6 +174,41 @@ def handle_simple_query(question):
     
     return None
 
+# Function to render one stored chat turn
+def render_history_entry(entry, store):
+    with st.chat_message("user"):
+        st.markdown(entry.question)
+    
+    with st.chat_message("assistant"):
+        st.markdown(entry.preview)
+        if entry.truncated:
+            # Only a preview is kept in memory; fetch the rest from SQLite on request
+            if st.button("Show full answer", key=f"full_{entry.id}"):
+                st.markdown(store.full_answer(entry.id))
+        st.caption(f"Execution time: {entry.elapsed:.2f} seconds")
+
+# Function to render turns older than the in-memory buffer, one page at a time
+def render_older_history(store):
+    older = store.older_count()
+    if not older:
+        return
+    
+    pages = (older + PAGE_SIZE - 1) // PAGE_SIZE
+    page = min(st.session_state.history_page, pages - 1)
+    
+    with st.expander(f"Earlier messages ({older})"):
+        prev_col, info_col, next_col = st.columns([1, 2, 1])
+        if prev_col.button("Older", disabled=page >= pages - 1):
+            st.session_state.history_page = page + 1
+            st.rerun()
+        info_col.caption(f"Page {page + 1} of {pages}")
+        if next_col.button("Newer", disabled=page == 0):
+            st.session_state.history_page = page - 1
+            st.rerun()
+        
+        for entry in store.older_page(page):
+            render_history_entry(entry, store)
+
 # Main content area
 st.title("🤖 SQL Query Agent with Llama 3")
 st.markdown("Ask natural language questions about your database and get answers!")
@@ -168,22 +220,15 @@ if st.session_state.db_connected and 'table_info' in st.session_state:
 
 # Chat interface
 if st.session_state.agent and st.session_state.db_connected:
-    # Display chat history
-    for i, (question, answer, execution_time) in enumerate(st.session_state.history):
-        with st.chat_message("user"):
-            st.markdown(question)
-        
-        with st.chat_message("assistant"):
-            st.markdown(answer)
-            st.caption(f"Execution time: {execution_time:.2f} seconds")
+    # Display chat history (older turns are paged in from SQLite)
+    render_older_history(st.session_state.history)
+    for entry in st.session_state.history.recent:
+        render_history_entry(entry, st.session_state.history)
     
     # Input for new question
     question = st.chat_input("Ask a question about your database...")
     
     if question:
-        # Add user question to history and display
-        st.session_state.history.append((question, "", 0))
-        
         with st.chat_message("user"):
             st.markdown(question)
         
@@ -201,13 +246,22 @@ if st.session_state.agent and st.session_state.db_connected:
                     answer = simple_answer
                     execution_time = time.time() - start_time
                 else:
-                    # Use the agent for complex queries with a simpler prompt
-                    response = st.session_state.agent.run(question)
-                    answer = clean_agent_response(response)
+                    # Use the agent for complex queries, bounded by the time budget
+                    response = st.session_state.agent.ask(question, budget=time_budget)
+                    if response["status"] == "timeout":
+                        timings = ", ".join(f"{k}: {v:.2f}s" for k, v in response["timings"].items())
+                        answer = f"⏱ {response['answer']}\n\nTime spent — {timings}"
+                        if response["partial"]:
+                            answer += f"\n\nPartial result:\n```\n{response['partial']}\n```"
+                    else:
+                        answer = clean_agent_response(response["answer"])
+                        if len(st.session_state.agent.tiers) > 1:
+                            path = " → ".join(tier for tier, _, _ in response["attempts"])
+                            answer += f"\n\n_Answered by {response['tier']} ({path}, confidence {response['confidence']:.0%})_"
                     execution_time = time.time() - start_time
                 
                 # Update history
-                st.session_state.history[-1] = (question, answer, execution_time)
+                st.session_state.history.append(question, answer, execution_time)
                 
                 # Display response
                 message_placeholder.markdown(answer)
@@ -223,11 +277,18 @@ if st.session_state.agent and st.session_state.db_connected:
                     error_msg += ". Try simplifying your question or increasing the max iterations in settings."
                 
                 message_placeholder.markdown(f"❌ {error_msg}")
-                st.session_state.history[-1] = (question, f"Error: {str(e)}", execution_time)
+                st.session_state.history.append(question, f"Error: {str(e)}", execution_time)
+    
+    # Per-model hit rates and latency, for tuning the cascade
+    with st.sidebar.expander("Model Cascade Stats"):
+        for tier, t in get_cascade_stats().snapshot().items():
+            st.caption(f"**{tier}**: {t['attempts']} tries, hit rate {t['hit_rate']:.0%}, "
+                       f"escalated {t['escalated']}, avg {t['avg_latency']:.2f}s (p95 {t['p95_latency']:.2f}s)")
     
     # Add clear history button
     if st.sidebar.button("Clear History"):
-        st.session_state.history = []
+        st.session_state.history.clear()
+        st.session_state.history_page = 0
         st.rerun()
         
 else: